@@ -97,6 +97,8 @@ class Constants:
     JS_MIMETYPE = "text/javascript"
     EXCEL_MIMETYPE = "application/vnd.ms-excel"
     XML_MIMETYPE = "text/xml"
+    SVG_MIMETYPE = "image/svg+xml"
+    PNG_MIMETYPE = "image/png"
 
     # JSON Schema; Draft 7 validator is currently hardwired.
     JSON_SCHEMA_URL = "http://json-schema.org/draft-07/schema#"
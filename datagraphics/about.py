@@ -12,6 +12,7 @@ import marko
 import requests
 
 from datagraphics import constants
+from datagraphics import render
 from datagraphics import utils
 
 
@@ -26,7 +27,7 @@ def software():
 
 def get_software():
     v = sys.version_info
-    return [
+    result = [
         ("DataGraphics", constants.VERSION, constants.URL),
         ("Python", f"{v.major}.{v.minor}.{v.micro}", "https://www.python.org/"),
         ("Flask", flask.__version__, "http://flask.pocoo.org/"),
@@ -54,6 +55,15 @@ def get_software():
         ("Vega-Lite", constants.VEGA_LITE_VERSION, constants.VEGA_LITE_URL),
         ("Vega-Embed", constants.VEGA_EMBED_VERSION, constants.VEGA_EMBED_URL),
     ]
+    if render.is_available():
+        result.append(
+            (
+                "vl-convert",
+                render.vl_convert.__version__,
+                "https://pypi.org/project/vl-convert-python/",
+            )
+        )
+    return result
 
 
 @blueprint.route("/contact")
@@ -76,5 +86,4 @@ def settings():
     ]:
         if config.get(key):
             config[key] = "<hidden>"
-    config.pop("VEGA_LITE_SCHEMA", None)
     return flask.render_template("about/settings.html", items=sorted(config.items()))
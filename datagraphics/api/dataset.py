@@ -7,7 +7,10 @@ import flask
 import flask_cors
 
 from datagraphics.dataset import (
+    CONTENT_MIMETYPES,
     DatasetSaver,
+    get_content_response,
+    get_query_response,
     get_dataset,
     get_graphics,
     allow_view,
@@ -17,6 +20,7 @@ from datagraphics.dataset import (
 )
 from datagraphics import constants
 from datagraphics import utils
+from datagraphics.query import Query, parse_args
 from datagraphics.api import schema_definitions
 
 blueprint = flask.Blueprint("api_dataset", __name__)
@@ -61,7 +65,9 @@ def serve(iuid):
             flask.abort(http.client.FORBIDDEN)
         set_links(dataset)
         return utils.jsonify(
-            dataset, schema=flask.url_for("api_schema.dataset", _external=True)
+            dataset,
+            schema=flask.url_for("api_schema.dataset", _external=True),
+            etag=get_etag(dataset),
         )
 
     elif utils.http_POST(csrf=False):
@@ -99,16 +105,18 @@ def serve(iuid):
             flask.abort(http.client.FORBIDDEN)
         if not allow_delete(dataset):
             flask.abort(http.client.FORBIDDEN)
-        flask.g.db.delete(dataset)
+        utils.delete_document(dataset)
         for log in utils.get_logs(dataset["_id"], cleanup=False):
             flask.g.db.delete(log)
         return "", http.client.NO_CONTENT
 
 
-@blueprint.route("/<iuid:iuid>.<ext>", methods=["GET", "PUT"])
+@blueprint.route("/<iuid:iuid>.<ext>", methods=["GET", "PUT", "POST"])
 @flask_cors.cross_origin(methods=["GET"])
 def content(iuid, ext):
-    "Fetch or update the content of the dataset as JSON or CSV file."
+    """Fetch or update the content of the dataset as JSON or CSV file.
+    POST with argument 'mode=append' appends the records to the content.
+    """
     try:
         dataset = get_dataset(iuid)
     except ValueError as error:
@@ -119,17 +127,10 @@ def content(iuid, ext):
             flask.abort(http.client.FORBIDDEN)
         if not dataset.get("_attachments", None):
             return "", http.client.NO_CONTENT
-        if ext == "json":
-            outfile = flask.g.db.get_attachment(dataset, "data.json")
-            response = flask.make_response(outfile.read())
-            response.headers.set("Content-Type", constants.JSON_MIMETYPE)
-        elif ext == "csv":
-            outfile = flask.g.db.get_attachment(dataset, "data.csv")
-            response = flask.make_response(outfile.read())
-            response.headers.set("Content-Type", constants.CSV_MIMETYPE)
-        else:
+        try:
+            return get_content_response(dataset, ext)
+        except KeyError:
             flask.abort(http.client.NOT_FOUND)
-        return response
 
     elif utils.http_PUT():
         if not allow_edit(dataset):
@@ -147,6 +148,41 @@ def content(iuid, ext):
             return str(error), http.client.BAD_REQUEST
         return "", http.client.NO_CONTENT
 
+    elif utils.http_POST(csrf=False):
+        if not allow_edit(dataset):
+            flask.abort(http.client.FORBIDDEN)
+        if flask.request.args.get("mode") != "append":
+            return "Invalid or missing mode; must be 'append'.", http.client.BAD_REQUEST
+        try:
+            content_type = CONTENT_MIMETYPES[ext]
+        except KeyError:
+            flask.abort(http.client.NOT_FOUND)
+        try:
+            with DatasetSaver(dataset) as saver:
+                saver.append_data(io.BytesIO(flask.request.data), content_type)
+        except ValueError as error:
+            return str(error), http.client.BAD_REQUEST
+        return "", http.client.NO_CONTENT
+
+
+@blueprint.route("/<iuid:iuid>/query")
+@flask_cors.cross_origin(methods=["GET"])
+def query(iuid):
+    """Return the result of a query on the content of the dataset as JSON.
+    Projection, filter, binning and aggregates are given as arguments.
+    """
+    try:
+        dataset = get_dataset(iuid)
+    except ValueError as error:
+        flask.abort(http.client.NOT_FOUND)
+    if not allow_view(dataset):
+        flask.abort(http.client.FORBIDDEN)
+    try:
+        query = Query(parse_args(flask.request.args), dataset.get("meta", {}))
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    return get_query_response(dataset, query)
+
 
 @blueprint.route("/<iuid:iuid>/logs")
 @flask_cors.cross_origin(methods=["GET"])
@@ -189,7 +225,6 @@ def set_links(dataset):
                     ext="csv",
                     _external=True,
                 ),
-                "size": atts["data.csv"]["length"],
             },
             "json": {
                 "href": flask.url_for(
@@ -201,6 +236,9 @@ def set_links(dataset):
                 "size": atts["data.json"]["length"],
             },
         }
+        # The CSV content may be produced on demand; size is then unknown.
+        if "data.csv" in atts:
+            dataset["content"]["csv"]["size"] = atts["data.csv"]["length"]
     # Add the links to the graphics for the dataset.
     dataset["graphics"] = [
         {
@@ -216,6 +254,15 @@ def set_links(dataset):
     }
 
 
+def get_etag(dataset):
+    """Return the ETag for the dataset resource with its links set, from its
+    revision, the links to its graphics, and the current user, who may not
+    be allowed to view all of them.
+    """
+    user = flask.g.current_user or {}
+    return utils.get_etag(dataset["_rev"], dataset["graphics"], user.get("username"))
+
+
 schema = {
     "$schema": constants.JSON_SCHEMA_URL,
     "title": "JSON Schema for API Dataset resource.",
@@ -250,6 +297,7 @@ schema = {
                     "mean": {"type": "number"},
                     "median": {"type": "number"},
                     "stdev": {"type": "number", "minimum": 0.0},
+                    "approximate": {"type": "boolean"},
                 },
                 "required": ["type", "n_null"],
                 "additionalProperties": False,
@@ -11,10 +11,18 @@ from datagraphics.datasets import (
     get_datasets_owner,
     get_datasets_editor,
 )
+from datagraphics.dataset import (
+    DatasetSaver,
+    get_dataset,
+    allow_edit,
+    allow_delete,
+    possible_delete,
+)
 import datagraphics.user
 from datagraphics import constants
 from datagraphics import utils
 from datagraphics.api import schema_definitions
+from datagraphics.saver import save_bulk
 
 blueprint = flask.Blueprint("api_datasets", __name__)
 
@@ -24,7 +32,12 @@ blueprint = flask.Blueprint("api_datasets", __name__)
 def public():
     "Get all public datasets."
     datasets = []
-    for dataset in get_datasets_public(full=True):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_datasets_public(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for dataset in page:
         datasets.append(
             {
                 "href": flask.url_for(
@@ -35,8 +48,11 @@ def public():
                 "modified": dataset["modified"],
             }
         )
+    result = {"datasets": datasets}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"datasets": datasets},
+        result,
         schema=flask.url_for("api_schema.datasets", _external=True),
     )
 
@@ -47,7 +63,12 @@ def user(username):
     if not datagraphics.user.am_admin_or_self(username=username):
         flask.abort(http.client.FORBIDDEN)
     datasets = []
-    for iuid, title, modified in get_datasets_owner(username):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_datasets_owner(username, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, modified in page:
         datasets.append(
             {
                 "href": flask.url_for("api_dataset.serve", iuid=iuid, _external=True),
@@ -55,8 +76,11 @@ def user(username):
                 "modified": modified,
             }
         )
+    result = {"datasets": datasets}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"datasets": datasets},
+        result,
         schema=flask.url_for("api_schema.datasets", _external=True),
     )
 
@@ -67,7 +91,12 @@ def editor(username):
     if not datagraphics.user.am_admin_or_self(username=username):
         flask.abort(http.client.FORBIDDEN)
     datasets = []
-    for iuid, title, modified in get_datasets_editor(username):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_datasets_editor(username, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, modified in page:
         datasets.append(
             {
                 "href": flask.url_for("api_dataset.serve", iuid=iuid, _external=True),
@@ -75,8 +104,11 @@ def editor(username):
                 "modified": modified,
             }
         )
+    result = {"datasets": datasets}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"datasets": datasets},
+        result,
         schema=flask.url_for("api_schema.datasets", _external=True),
     )
 
@@ -87,7 +119,12 @@ def all():
     if not flask.g.am_admin:
         flask.abort(http.client.FORBIDDEN)
     datasets = []
-    for iuid, title, owner, modified in get_datasets_all():
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_datasets_all(cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, owner, modified in page:
         datasets.append(
             {
                 "href": flask.url_for("api_dataset.serve", iuid=iuid, _external=True),
@@ -96,12 +133,118 @@ def all():
                 "modified": modified,
             }
         )
+    result = {"datasets": datasets}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"datasets": datasets},
+        result,
         schema=flask.url_for("api_schema.datasets", _external=True),
     )
 
 
+@blueprint.route("/_bulk", methods=["POST"])
+def bulk():
+    """Create, update or delete several datasets. The documents and their
+    log entries are stored in one database request. The data content of
+    the datasets cannot be set via this resource.
+    """
+    if not flask.g.current_user:
+        flask.abort(http.client.FORBIDDEN)
+    data = flask.request.get_json()
+    try:
+        items = data["datasets"]
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            raise TypeError
+    except (KeyError, TypeError):
+        return "invalid bulk data", http.client.BAD_REQUEST
+    if len(items) > flask.current_app.config["BULK_MAX_ITEMS"]:
+        return "too many items", http.client.BAD_REQUEST
+    # The same document may not be staged twice; the second save would fail.
+    iuids = [item["iuid"] for item in items if item.get("iuid")]
+    if not all(isinstance(iuid, str) for iuid in iuids):
+        return "invalid iuid in bulk data", http.client.BAD_REQUEST
+    if len(iuids) != len(set(iuids)):
+        return "duplicate iuid in bulk data", http.client.BAD_REQUEST
+    utils.fetch_documents(iuids)
+    savers = []
+    deleted = []
+    results = []
+    for item in items:
+        result = bulk_item(item, savers, deleted)
+        if result.get("iuid"):
+            result["href"] = flask.url_for(
+                "api_dataset.serve", iuid=result["iuid"], _external=True
+            )
+        results.append(result)
+    errors = save_bulk(savers, deleted)
+    for result in results:
+        try:
+            result["error"] = errors[result["iuid"]]
+        except KeyError:
+            pass
+        else:
+            result["status"] = http.client.CONFLICT
+            result.pop("href", None)
+    return utils.jsonify(
+        {"datasets": results},
+        schema=flask.url_for("api_schema.bulk", _external=True),
+    )
+
+
+def bulk_item(item, savers, deleted):
+    """Handle one item of a bulk request. Append the staged saver, or the
+    dataset to delete, to the respective list. Return the result for the item.
+    """
+    iuid = item.get("iuid")
+    if iuid:
+        try:
+            dataset = get_dataset(iuid)
+        except ValueError as error:
+            return {"status": http.client.NOT_FOUND, "error": str(error)}
+        if item.get("delete"):
+            if not allow_delete(dataset) or not possible_delete(dataset):
+                return {
+                    "iuid": iuid,
+                    "status": http.client.FORBIDDEN,
+                    "error": "Delete of dataset not allowed.",
+                }
+            deleted.append(dataset)
+            return {"iuid": iuid, "status": http.client.NO_CONTENT}
+        if not allow_edit(dataset):
+            return {
+                "iuid": iuid,
+                "status": http.client.FORBIDDEN,
+                "error": "Edit access to dataset not allowed.",
+            }
+        saver = DatasetSaver(dataset)
+        status = http.client.OK
+    else:
+        saver = DatasetSaver()
+        status = http.client.CREATED
+        item.setdefault("title", None)
+        item.setdefault("description", "")
+        item.setdefault("public", False)
+    try:
+        if "title" in item:
+            saver.set_title(item["title"])
+        if "description" in item:
+            saver.set_description(item["description"])
+        if "public" in item:
+            saver.set_public(item["public"])
+        if "meta" in item:
+            try:
+                saver.set_vega_lite_types(item["meta"])
+            except (KeyError, TypeError, AttributeError):
+                raise ValueError("Invalid 'meta' value.")
+        saver.stage()
+    except ValueError as error:
+        # The cached document may have been partially modified.
+        utils.uncache_document(saver.doc["_id"])
+        return {"status": http.client.BAD_REQUEST, "error": str(error)}
+    savers.append(saver)
+    return {"iuid": saver.doc["_id"], "status": status}
+
+
 schema = {
     "$schema": constants.JSON_SCHEMA_URL,
     "title": "JSON Schema for API Datasets resource.",
@@ -110,6 +253,7 @@ schema = {
         "$id": {"type": "string", "format": "uri"},
         "timestamp": {"type": "string", "format": "date-time"},
         "datasets": {"type": "array", "items": schema_definitions.link},
+        "next": schema_definitions.link,
     },
     "required": ["$id", "timestamp", "datasets"],
     "additionalProperties": False,
@@ -64,3 +64,19 @@ CSV_URL = "http://127.0.0.1:5000/api/dataset/6e5696ff2059423ca40d3f59936a6671.cs
 
 response = requests.put(CSV_URL, headers={"x-apikey": APIKEY}, data=csv_data)
 print(response)  # Success if this is 204 (= HTTP "No Content").
+
+# ==== How to append records to the content. ====
+
+# Only the new records are sent, and they are checked against the
+# fields of the existing dataset. The existing records are kept.
+
+more_data = [
+    {"date": "2020-05-04", "count": 1422, "class": "negative"},
+    {"date": "2020-05-04", "count": 41, "class": "positive"},
+    {"date": "2020-05-04", "count": 2, "class": "failed"},
+]
+
+response = requests.post(
+    JSON_URL, headers={"x-apikey": APIKEY}, params={"mode": "append"}, json=more_data
+)
+print(response)  # Success if this is 204 (= HTTP "No Content").
@@ -62,7 +62,9 @@ def serve(iuid):
             flask.abort(http.client.FORBIDDEN)
         set_links(graphic)
         return utils.jsonify(
-            graphic, schema=flask.url_for("api_schema.graphic", _external=True)
+            graphic,
+            schema=flask.url_for("api_schema.graphic", _external=True),
+            etag=get_etag(graphic),
         )
 
     elif utils.http_POST(csrf=False):
@@ -98,7 +100,7 @@ def serve(iuid):
     elif utils.http_DELETE():
         if not allow_delete(graphic):
             flask.abort(http.client.FORBIDDEN)
-        flask.g.db.delete(graphic)
+        utils.delete_document(graphic)
         for log in utils.get_logs(graphic["_id"], cleanup=False):
             flask.g.db.delete(log)
         return "", http.client.NO_CONTENT
@@ -153,6 +155,15 @@ def set_links(graphic):
     }
 
 
+def get_etag(graphic):
+    """Return the ETag for the graphic resource with its links set, from its
+    revision, the link to its dataset, and the current user, who may not
+    be allowed to view the dataset.
+    """
+    user = flask.g.current_user or {}
+    return utils.get_etag(graphic["_rev"], graphic["dataset"], user.get("username"))
+
+
 schema = {
     "$schema": constants.JSON_SCHEMA_URL,
     "title": "JSON Schema for API Graphic resource.",
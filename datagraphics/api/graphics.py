@@ -11,10 +11,18 @@ from datagraphics.graphics import (
     get_graphics_owner,
     get_graphics_editor,
 )
+import datagraphics.dataset
+from datagraphics.graphic import (
+    GraphicSaver,
+    get_graphic,
+    allow_edit,
+    allow_delete,
+)
 import datagraphics.user
 from datagraphics import constants
 from datagraphics import utils
 from datagraphics.api import schema_definitions
+from datagraphics.saver import save_bulk
 
 blueprint = flask.Blueprint("api_graphics", __name__)
 
@@ -23,7 +31,12 @@ blueprint = flask.Blueprint("api_graphics", __name__)
 @flask_cors.cross_origin(methods=["GET"])
 def public():
     graphics = []
-    for graphic in get_graphics_public(full=True):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_graphics_public(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for graphic in page:
         graphics.append(
             {
                 "href": flask.url_for(
@@ -34,8 +47,11 @@ def public():
                 "modified": graphic["modified"],
             }
         )
+    result = {"graphics": graphics}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"graphics": graphics},
+        result,
         schema=flask.url_for("api_schema.graphics", _external=True),
     )
 
@@ -45,7 +61,12 @@ def user(username):
     if not datagraphics.user.am_admin_or_self(username=username):
         flask.abort(http.client.FORBIDDEN)
     graphics = []
-    for iuid, title, modified in get_graphics_owner(username):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_graphics_owner(username, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, modified in page:
         graphics.append(
             {
                 "href": flask.url_for("api_graphic.serve", iuid=iuid, _external=True),
@@ -53,8 +74,11 @@ def user(username):
                 "modified": modified,
             }
         )
+    result = {"graphics": graphics}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"graphics": graphics},
+        result,
         schema=flask.url_for("api_schema.graphics", _external=True),
     )
 
@@ -65,7 +89,12 @@ def editor(username):
     if not datagraphics.user.am_admin_or_self(username=username):
         flask.abort(http.client.FORBIDDEN)
     graphics = []
-    for iuid, title, modified in get_graphics_editor(username):
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_graphics_editor(username, cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, modified in page:
         graphics.append(
             {
                 "href": flask.url_for("api_graphic.serve", iuid=iuid, _external=True),
@@ -73,8 +102,11 @@ def editor(username):
                 "modified": modified,
             }
         )
+    result = {"graphics": graphics}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"graphics": graphics},
+        result,
         schema=flask.url_for("api_schema.graphics", _external=True),
     )
 
@@ -84,7 +116,12 @@ def all():
     if not flask.g.am_admin:
         flask.abort(http.client.FORBIDDEN)
     graphics = []
-    for iuid, title, owner, modified in get_graphics_all():
+    try:
+        cursor, limit = utils.get_paging()
+        page = get_graphics_all(cursor=cursor, limit=limit)
+    except ValueError as error:
+        return str(error), http.client.BAD_REQUEST
+    for iuid, title, owner, modified in page:
         graphics.append(
             {
                 "href": flask.url_for("api_graphic.serve", iuid=iuid, _external=True),
@@ -93,12 +130,122 @@ def all():
                 "modified": modified,
             }
         )
+    result = {"graphics": graphics}
+    if page.next:
+        result["next"] = {"href": utils.get_next_url(page, _external=True)}
     return utils.jsonify(
-        {"graphics": graphics},
+        result,
         schema=flask.url_for("api_schema.graphics", _external=True),
     )
 
 
+@blueprint.route("/_bulk", methods=["POST"])
+def bulk():
+    """Create, update or delete several graphics. The documents and their
+    log entries are stored in one database request.
+    """
+    if not flask.g.current_user:
+        flask.abort(http.client.FORBIDDEN)
+    data = flask.request.get_json()
+    try:
+        items = data["graphics"]
+        if not isinstance(items, list) or not all(isinstance(i, dict) for i in items):
+            raise TypeError
+    except (KeyError, TypeError):
+        return "invalid bulk data", http.client.BAD_REQUEST
+    if len(items) > flask.current_app.config["BULK_MAX_ITEMS"]:
+        return "too many items", http.client.BAD_REQUEST
+    # The same document may not be staged twice; the second save would fail.
+    iuids = [item["iuid"] for item in items if item.get("iuid")]
+    if not all(isinstance(iuid, str) for iuid in iuids):
+        return "invalid iuid in bulk data", http.client.BAD_REQUEST
+    if len(iuids) != len(set(iuids)):
+        return "duplicate iuid in bulk data", http.client.BAD_REQUEST
+    datasets = [item["dataset"] for item in items if item.get("dataset")]
+    if not all(isinstance(iuid, str) for iuid in datasets):
+        return "invalid dataset in bulk data", http.client.BAD_REQUEST
+    utils.fetch_documents(iuids + datasets)
+    savers = []
+    deleted = []
+    results = []
+    for item in items:
+        result = bulk_item(item, savers, deleted)
+        if result.get("iuid"):
+            result["href"] = flask.url_for(
+                "api_graphic.serve", iuid=result["iuid"], _external=True
+            )
+        results.append(result)
+    errors = save_bulk(savers, deleted)
+    for result in results:
+        try:
+            result["error"] = errors[result["iuid"]]
+        except KeyError:
+            pass
+        else:
+            result["status"] = http.client.CONFLICT
+            result.pop("href", None)
+    return utils.jsonify(
+        {"graphics": results},
+        schema=flask.url_for("api_schema.bulk", _external=True),
+    )
+
+
+def bulk_item(item, savers, deleted):
+    """Handle one item of a bulk request. Append the staged saver, or the
+    graphic to delete, to the respective list. Return the result for the item.
+    """
+    iuid = item.get("iuid")
+    if iuid:
+        try:
+            graphic = get_graphic(iuid)
+        except ValueError as error:
+            return {"status": http.client.NOT_FOUND, "error": str(error)}
+        if item.get("delete"):
+            if not allow_delete(graphic):
+                return {
+                    "iuid": iuid,
+                    "status": http.client.FORBIDDEN,
+                    "error": "Delete of graphic not allowed.",
+                }
+            deleted.append(graphic)
+            return {"iuid": iuid, "status": http.client.NO_CONTENT}
+        if not allow_edit(graphic):
+            return {
+                "iuid": iuid,
+                "status": http.client.FORBIDDEN,
+                "error": "Edit access to graphic not allowed.",
+            }
+        saver = GraphicSaver(graphic)
+        status = http.client.OK
+    else:
+        saver = GraphicSaver()
+        status = http.client.CREATED
+        item.setdefault("title", None)
+        item.setdefault("description", "")
+        item.setdefault("public", False)
+        item.setdefault("specification", {})
+    try:
+        if not iuid:
+            saver.set_dataset(datagraphics.dataset.get_dataset(item.get("dataset")))
+        if "title" in item:
+            saver.set_title(item["title"])
+        if "description" in item:
+            saver.set_description(item["description"])
+        if "public" in item:
+            saver.set_public(item["public"])
+        if "specification" in item:
+            if not isinstance(item["specification"], dict):
+                raise ValueError("Invalid 'specification' value.")
+            saver.set_specification(item["specification"])
+        saver.stage()
+    except ValueError as error:
+        # The cached document may have been partially modified.
+        utils.uncache_document(saver.doc["_id"])
+        return {"status": http.client.BAD_REQUEST, "error": str(error)}
+    savers.append(saver)
+    return {"iuid": saver.doc["_id"], "status": status}
+
+
 schema = {
     "$schema": constants.JSON_SCHEMA_URL,
     "title": "JSON Schema for API Graphics resource.",
@@ -107,6 +254,7 @@ schema = {
         "$id": {"type": "string", "format": "uri"},
         "timestamp": {"type": "string", "format": "date-time"},
         "graphics": {"type": "array", "items": schema_definitions.link},
+        "next": schema_definitions.link,
     },
     "required": ["$id", "timestamp", "graphics"],
     "additionalProperties": False,
@@ -5,6 +5,7 @@ import flask_cors
 
 from datagraphics import constants
 from datagraphics import utils
+from datagraphics.api import schema_definitions
 from datagraphics.api import root as api_root
 from datagraphics.api import about as api_about
 from datagraphics.api import dataset as api_dataset
@@ -65,6 +66,10 @@ def all():
                     "href": flask.url_for("api_schema.logs", _external=True),
                     "title": logs_schema["title"],
                 },
+                "bulk": {
+                    "href": flask.url_for("api_schema.bulk", _external=True),
+                    "title": bulk_schema["title"],
+                },
             },
         },
         schema=flask.url_for("api_schema.schemas", _external=True),
@@ -134,6 +139,13 @@ def logs():
     return utils.jsonify(logs_schema, schema=constants.JSON_SCHEMA_URL)
 
 
+@blueprint.route("bulk")
+@flask_cors.cross_origin(methods=["GET"])
+def bulk():
+    "JSON schema for API bulk request results."
+    return utils.jsonify(bulk_schema, schema=constants.JSON_SCHEMA_URL)
+
+
 @blueprint.route("schemas")
 @flask_cors.cross_origin(methods=["GET"])
 def schemas():
@@ -173,6 +185,7 @@ schema = {
                 "users": {"$ref": "#/definitions/link"},
                 "schemas": {"$ref": "#/definitions/link"},
                 "logs": {"$ref": "#/definitions/link"},
+                "bulk": {"$ref": "#/definitions/link"},
             }
         },
     },
@@ -243,3 +256,17 @@ logs_schema = {
     "required": ["$id", "timestamp", "entity", "logs"],
     "additionalProperties": False,
 }
+
+bulk_schema = {
+    "$schema": constants.JSON_SCHEMA_URL,
+    "title": "JSON Schema for API bulk request results.",
+    "type": "object",
+    "properties": {
+        "$id": {"type": "string", "format": "uri"},
+        "timestamp": {"type": "string", "format": "date-time"},
+        "datasets": {"type": "array", "items": schema_definitions.bulk_result},
+        "graphics": {"type": "array", "items": schema_definitions.bulk_result},
+    },
+    "required": ["$id", "timestamp"],
+    "additionalProperties": False,
+}
@@ -28,6 +28,19 @@ user = {
     "additionalProperties": False,
 }
 
+bulk_result = {
+    "title": "The result for an item in a bulk request.",
+    "type": "object",
+    "properties": {
+        "iuid": {"type": "string", "pattern": "^[0-9a-f]{32,32}$"},
+        "href": {"type": "string", "format": "uri"},
+        "status": {"type": "integer"},
+        "error": {"type": "string"},
+    },
+    "required": ["status"],
+    "additionalProperties": False,
+}
+
 logs_link = {
     "title": "Link to the log of changes for the entity.",
     "type": "object",
@@ -0,0 +1,137 @@
+"Column store for the records of a dataset."
+
+import array
+import csv
+import io
+import json
+import sys
+
+# Typecodes for the 'array' module by field type; string values are in lists.
+TYPECODES = {"integer": "q", "number": "d", "boolean": "b"}
+
+
+class Column:
+    """Values of one field. Integer, number and boolean values are stored
+    in a typed array, with a bitmap marking the null values.
+    String values are interned and stored in a list; None for null.
+    """
+
+    def __init__(self, type):
+        self.type = type
+        self.n_null = 0
+        try:
+            self.data = array.array(TYPECODES[type])
+            self.nulls = bytearray()
+        except KeyError:
+            self.data = []
+            self.nulls = None
+
+    def __len__(self):
+        return len(self.data)
+
+    def append(self, value):
+        "Append the value, which must have been converted to the field type."
+        if self.nulls is None:
+            if value is None:
+                self.n_null += 1
+            else:
+                value = sys.intern(value)
+            self.data.append(value)
+            return
+        pos = len(self.data)
+        if pos % 8 == 0:
+            self.nulls.append(0)
+        if value is None:
+            self.nulls[pos >> 3] |= 1 << (pos & 7)
+            self.n_null += 1
+            value = 0
+        try:
+            self.data.append(value)
+        except OverflowError:
+            # Integer too large for the array; fall back to a plain list.
+            self.data = self.data.tolist()
+            self.data.append(value)
+
+    def __iter__(self):
+        "Return an iterator over the values, with None for null."
+        if self.type == "boolean":
+            values = map(bool, self.data)
+        else:
+            values = iter(self.data)
+        if not self.n_null or self.nulls is None:
+            return values
+        return (
+            None if self.nulls[pos >> 3] & (1 << (pos & 7)) else value
+            for pos, value in enumerate(values)
+        )
+
+    def non_null(self):
+        """Return the non-null values as a sequence.
+        Returns the storage itself when there are no null values.
+        """
+        if not self.n_null:
+            if self.type == "boolean":
+                return [bool(v) for v in self.data]
+            return self.data
+        values = [v for v in self if v is not None]
+        try:
+            return array.array(TYPECODES[self.type], values)
+        except (KeyError, OverflowError):
+            return values
+
+
+class Columns:
+    "Records of a dataset stored by column, in the order of the fields in 'meta'."
+
+    def __init__(self, meta):
+        self.keys = list(meta.keys())
+        self.columns = dict((key, Column(meta[key]["type"])) for key in self.keys)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def append(self, record):
+        """Append a record, which must have been converted and checked
+        with respect to 'meta'. Items not in 'meta' are ignored.
+        """
+        for key, column in self.columns.items():
+            column.append(record.get(key))
+        self.length += 1
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def records(self):
+        "Return a generator of the records as dictionaries."
+        keys = self.keys
+        for values in zip(*[self.columns[key] for key in keys]):
+            yield dict(zip(keys, values))
+
+    def get_json(self):
+        "Return the records as UTF-8 encoded JSON, a list of objects."
+        parts = [b"["]
+        dumps = json.JSONEncoder(ensure_ascii=False).encode
+        for pos, record in enumerate(self.records()):
+            if pos:
+                parts.append(b", ")
+            parts.append(dumps(record).encode("utf-8"))
+        parts.append(b"]")
+        return b"".join(parts)
+
+    def get_csv(self, header=True):
+        "Return the records as UTF-8 encoded CSV, with a header row if set."
+        outfile = io.BytesIO()
+        textfile = io.TextIOWrapper(outfile, encoding="utf-8", newline="")
+        writer = csv.writer(textfile)
+        if header:
+            writer.writerow(self.keys)
+        # Let CSV write None as empty string, like csv.DictWriter does.
+        writer.writerows(zip(*[self.columns[key] for key in self.keys]))
+        textfile.flush()
+        textfile.detach()
+        return outfile.getvalue()
@@ -32,13 +32,34 @@ DEFAULT_SETTINGS = dict(
     COUCHDB_USERNAME=None,
     COUCHDB_PASSWORD=None,
     COUCHDB_DBNAME="datagraphics",
+    COUCHDB_POOL_SIZE=10,  # Max number of connections kept alive per process.
+    COUCHDB_HEALTH_CHECK=60,  # Seconds unused before the connection is checked.
     JSON_AS_ASCII=False,
     JSON_SORT_KEYS=False,
     JSONIFY_PRETTYPRINT_REGULAR=False,
     MAX_RECORDS_INSPECT=2000,
+    CSV_ENCODING_DETECT_SIZE=65536,  # Bytes of CSV file used to detect encoding.
+    CSV_CHUNK_SIZE=10000,  # Number of CSV records parsed per chunk.
+    META_APPROXIMATE_THRESHOLD=1000000,  # Number of records; approximate stats.
+    DATASET_MERGE_THRESHOLD=100000,  # Number of records; append merges stats.
+    DATASET_STORE_CSV=True,  # If False, CSV content is produced on demand.
+    DERIVED_CACHE_SIZE=64 * 1024 * 1024,  # Bytes of content produced on demand.
+    VEGA_LITE_PUSHDOWN_RECORDS=100000,  # Aggregate on server above this; 0 never.
+    RENDER_CACHE_DIRPATH=None,  # Rendered graphics directory; needed for thumbnails.
+    RENDER_CACHE_SIZE=256 * 1024 * 1024,  # Bytes of rendered graphics on disk.
+    RENDER_THUMBNAIL_SCALE=0.25,  # Scale of PNG thumbnails relative to graphic.
+    DOWNLOAD_CHUNK_SIZE=64 * 1024,  # Bytes per chunk of streamed content.
+    ATTACHMENT_INLINE_SIZE=1024 * 1024,  # Max bytes of attachment stored inline.
+    DOCUMENT_CACHE_SIZE=32 * 1024 * 1024,  # Bytes of cached documents; 0 disables.
+    DOCUMENT_CACHE_REFRESH=1.0,  # Seconds between checks of the changes feed.
+    USER_CACHE_TTL=60,  # Seconds a user lookup is remembered; 0 disables.
     MIN_PASSWORD_LENGTH=6,
     PERMANENT_SESSION_LIFETIME=7 * 24 * 60 * 60,  # in seconds: 1 week
     MAX_HOME_LIST_ITEMS=10,
+    LIST_PAGE_SIZE=100,  # Page size of HTML lists; of API lists given a cursor.
+    LIST_MAX_PAGE_SIZE=1000,  # Max number of items in a page of an API list.
+    BULK_MAX_ITEMS=1000,  # Max number of items in an API bulk request.
+    LOG_WRITE_BEHIND=False,  # Write log entries after sending the response.
     URL_UPDATE_TIMEOUT=5.0,
     MAIL_SERVER=None,  # e.g. "localhost", if set up.
     MAIL_PORT=25,
@@ -124,42 +145,6 @@ def init(app):
     if app.config["REVERSE_PROXY"]:
         app.wsgi_app = ProxyFix(app.wsgi_app)
 
-    # Read and preprocess the documentation file.
-    with open("documentation.md") as infile:
-        lines = infile.readlines()
-    toc = []
-    current_level = 0
-    for line in lines:
-        if line.startswith("#"):
-            parts = line.split()
-            level = len(parts[0])
-            title = " ".join(parts[1:])
-            # All headers in the file are "clean", i.e. text only, no markup.
-            id = title.strip().replace(" ", "-").lower()
-            id = "".join(c for c in id if c in constants.ALLOWED_ID_CHARACTERS)
-            # Add to table of contents.
-            if level <= 2:
-                if level > current_level:
-                    for l in range(current_level, level):
-                        toc.append('<ul class="list-unstyled ml-3">')
-                    current_level = level
-                elif level < current_level:
-                    for l in range(level, current_level):
-                        toc.append("</ul>")
-                    current_level = level
-                toc.append(f'<li><a href="#{id}">{title}</a></li>')
-    for level in range(current_level):
-        toc.append("</ul>")
-    app.config["DOCUMENTATION_TOC"] = "\n".join(toc)
-    app.config["DOCUMENTATION"] = utils.markdown2html("".join(lines))
-
-    # Read in JSON Schema for Vega-Lite from file in 'static'.
-    filepath = os.path.join(
-        constants.ROOT, f"static/v{constants.VEGA_LITE_VERSION}.json"
-    )
-    with open(filepath) as infile:
-        app.config["VEGA_LITE_SCHEMA"] = json.load(infile)
-
     # Read in stencil JSON specifications from files in 'stencils'.
     app.config["STENCILS"] = {}
     for rootpath in ["stencils", "../site/stencils"]:
@@ -179,7 +164,13 @@ def init(app):
 
 
 def load_db_designs(app):
-    "Load the design documents."
-    datagraphics.dataset.init(app)
-    datagraphics.graphic.init(app)
-    datagraphics.user.init(app)
+    "Load the design documents, if changed."
+    utils.put_designs(
+        {
+            "logs": utils.DESIGN_DOC,
+            "datasets": datagraphics.dataset.DESIGN_DOC,
+            "graphics": datagraphics.graphic.DESIGN_DOC,
+            "users": datagraphics.user.DESIGN_DOC,
+        },
+        app=app,
+    )
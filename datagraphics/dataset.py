@@ -1,10 +1,11 @@
 "Dataset to display graphic of."
 
 import csv
+import hashlib
 import io
 import json
 import http.client
-import statistics
+import itertools
 
 import chardet
 import couchdb2
@@ -16,7 +17,9 @@ import datagraphics.user
 from datagraphics import constants
 from datagraphics import utils
 
+from datagraphics.columns import Columns
 from datagraphics.saver import EntitySaver
+from datagraphics.summary import Summary
 
 TYPE_NAME_MAP = {int: "integer", float: "number", bool: "boolean", str: "string"}
 
@@ -42,27 +45,22 @@ TYPE_OBJECT_MAP2 = TYPE_OBJECT_MAP.copy()
 TYPE_OBJECT_MAP2["boolean"] = bool2
 
 
-def init(app):
-    "Initialize; update CouchDB design document."
-    db = utils.get_db(app=app)
-    logger = utils.get_logger(app)
-    if db.put_design("datasets", DESIGN_DOC):
-        logger.info("Updated datasets design document.")
-
-
 DESIGN_DOC = {
     "views": {
         "public_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'dataset' || !doc.public) return; emit(doc.modified, doc.title);}",
+            "map": "function(doc) {if (doc.doctype !== 'dataset' || !doc.public) return; emit(doc.modified, {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'n_records': doc.n_records || 0, 'n_fields': Object.keys(doc.meta || {}).length, 'size': Object.keys(doc._attachments || {}).reduce(function(s, k) {return k === 'summary.json' ? s : s + doc._attachments[k].length;}, 0)});}",
         },
         "owner_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'dataset') return; emit([doc.owner, doc.modified], doc.title);}",
+            "map": "function(doc) {if (doc.doctype !== 'dataset') return; emit([doc.owner, doc.modified], {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'n_records': doc.n_records || 0, 'n_fields': Object.keys(doc.meta || {}).length, 'size': Object.keys(doc._attachments || {}).reduce(function(s, k) {return k === 'summary.json' ? s : s + doc._attachments[k].length;}, 0)});}",
         },
         "editor_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'dataset') return; if (!doc.editors) return; for (var i=0; i<doc.editors.length; i++) { emit([doc.editors[i], doc.modified], doc.title);}}",
+            "map": "function(doc) {if (doc.doctype !== 'dataset') return; if (!doc.editors) return; for (var i=0; i<doc.editors.length; i++) { emit([doc.editors[i], doc.modified], {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'n_records': doc.n_records || 0, 'n_fields': Object.keys(doc.meta || {}).length, 'size': Object.keys(doc._attachments || {}).reduce(function(s, k) {return k === 'summary.json' ? s : s + doc._attachments[k].length;}, 0)});}}",
+        },
+        "access": {
+            "map": "function(doc) {if (doc.doctype !== 'dataset') return; emit(doc._id, {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'editors': doc.editors || [], 'modified': doc.modified});}",
         },
         "file_size": {
             "reduce": "_sum",
@@ -107,16 +105,19 @@ def display(iuid):
     if not allow_view(dataset):
         utils.flash_error("View access to dataset not allowed.")
         return flask.redirect(flask.url_for("home"))
-    storage = sum([s["length"] for s in dataset.get("_attachments", {}).values()])
+    storage = get_content_size(dataset)
+    graphics = get_graphics(dataset)
+    # A user allowed to delete the dataset can view all graphics of its owner,
+    # so the check can be done on the list of graphics, without another query.
     return flask.render_template(
         "dataset/display.html",
         dataset=dataset,
-        graphics=get_graphics(dataset),
+        graphics=graphics,
         storage=storage,
         am_owner=am_owner(dataset),
         allow_edit=allow_edit(dataset),
         allow_delete=allow_delete(dataset),
-        possible_delete=possible_delete(dataset),
+        possible_delete=possible_delete(dataset, graphics=graphics),
         commands=get_commands(dataset),
     )
 
@@ -183,7 +184,7 @@ def edit(iuid):
         if not allow_delete(dataset):
             utils.flash_error("Delete access to dataset not allowed.")
             return flask.redirect(flask.url_for(".display", iuid=iuid))
-        flask.g.db.delete(dataset)
+        utils.delete_document(dataset)
         for log in utils.get_logs(dataset["_id"], cleanup=False):
             flask.g.db.delete(log)
         utils.flash_message("The dataset was deleted.")
@@ -316,15 +317,9 @@ def download(iuid, ext):
     if not dataset.get("_attachments", None):
         utils.flash_error("Dataset does not contain any data.")
         return flask.redirect(utils.url_referrer())
-    if ext == "json":
-        outfile = flask.g.db.get_attachment(dataset, "data.json")
-        response = flask.make_response(outfile.read())
-        response.headers.set("Content-Type", constants.JSON_MIMETYPE)
-    elif ext == "csv":
-        outfile = flask.g.db.get_attachment(dataset, "data.csv")
-        response = flask.make_response(outfile.read())
-        response.headers.set("Content-Type", constants.CSV_MIMETYPE)
-    else:
+    try:
+        response = get_content_response(dataset, ext)
+    except KeyError:
         utils.flash_error("Invalid file type requested.")
         return flask.redirect(utils.url_referrer())
     slug = utils.slugify(dataset["title"])
@@ -418,35 +413,86 @@ class DatasetSaver(EntitySaver):
             raise ValueError(f"Cannot handle content_type {content_type}")
         self.doc["n_records"] = len(data)
         self.update_meta(data)
-
-        # Data in JSON format.
-        json_content = json.dumps(data, ensure_ascii=False).encode("utf-8")
-
-        # Data in CSV format.
-        outfile = io.StringIO()
-        writer = csv.DictWriter(outfile, fieldnames=list(data[0].keys()))
-        writer.writeheader()
-        for record in data:
-            writer.writerow(record)
-        outfile.seek(0)
-        csv_content = outfile.read().encode("utf-8")
-
+        json_content = data.get_json()
+        if flask.current_app.config["DATASET_STORE_CSV"]:
+            csv_content = data.get_csv()
+        else:
+            csv_content = None
+        self.add_attachment("data.json", json_content, constants.JSON_MIMETYPE)
+        if csv_content is None:
+            # The CSV content will be produced on demand from the JSON content.
+            if "data.csv" in self.doc.get("_attachments", {}):
+                self.delete_attachment("data.csv")
+        else:
+            self.add_attachment("data.csv", csv_content, constants.CSV_MIMETYPE)
+        # Includes the summary state, if any.
+        self.check_quota(self.get_attachments_size())
+
+    def append_data(self, infile, content_type):
+        """Append the data from the input file (CSV or JSON) to the content
+        of this dataset. Only the new records are checked against 'meta'.
+        The stored content is extended without being parsed. For a dataset
+        having more than DATASET_MERGE_THRESHOLD records, the statistics are
+        updated by merging the stored summary state with the summary of the
+        new records, which makes the number of distinct values and the median
+        approximate. Otherwise the statistics are recomputed.
+        """
+        if not self.doc["meta"] or not self.doc.get("n_records"):
+            raise ValueError("Cannot append to a dataset without content.")
+        if content_type == constants.JSON_MIMETYPE:
+            data = self.get_json_data(infile)
+        elif content_type == constants.CSV_MIMETYPE:
+            data = self.get_csv_data(infile)
+        else:
+            raise ValueError(f"Cannot handle content_type {content_type}")
+        n_records = self.doc["n_records"] + len(data)
+        if n_records > flask.current_app.config["DATASET_MERGE_THRESHOLD"]:
+            self.merge_meta(data)
+        else:
+            columns = get_columns(self.doc)
+            columns.extend(data.records())
+            self.update_meta(columns)
+        self.doc["n_records"] = n_records
+
+        # Splice the new records into the JSON list of records.
+        json_content = flask.g.db.get_attachment(self.doc, "data.json").read()
+        json_content = json_content.rstrip()[:-1] + b", " + data.get_json()[1:]
+        if "data.csv" in self.doc["_attachments"]:
+            csv_content = flask.g.db.get_attachment(self.doc, "data.csv").read()
+            csv_content += data.get_csv(header=False)
+        else:
+            csv_content = None
+        self.add_attachment("data.json", json_content, constants.JSON_MIMETYPE)
+        if csv_content is not None:
+            self.add_attachment("data.csv", csv_content, constants.CSV_MIMETYPE)
+        self.check_quota(self.get_attachments_size(replaced=True))
+
+    def get_attachments_size(self, replaced=False):
+        """Return the total size of the attachments to be added, including
+        the summary state. If 'replaced' is True, less the size of the stored
+        attachments that they replace, or that are to be deleted.
+        """
+        added = dict(
+            [(a["filename"], len(a["content"])) for a in self._add_attachments]
+        )
+        result = sum(added.values())
+        if replaced:
+            stored = self.doc.get("_attachments", {})
+            for filename in set(added).union(self._delete_attachments):
+                if filename in stored:
+                    result -= stored[filename]["length"]
+        return result
+
+    def check_quota(self, size):
+        "Raise ValueError if adding the size would exceed the storage quota."
         if flask.g.current_user.get("quota_storage"):
             username = flask.g.current_user["username"]
-            total = (
-                len(json_content)
-                + len(csv_content)
-                + datagraphics.user.get_storage(username)
-            )
+            total = size + datagraphics.user.get_storage(username)
             if total > flask.g.current_user["quota_storage"]:
-                raise ValueError(
-                    f"File {infile.filename} not added;" " quota storage reached."
-                )
-        self.add_attachment("data.json", json_content, constants.JSON_MIMETYPE)
-        self.add_attachment("data.csv", csv_content, constants.CSV_MIMETYPE)
+                raise ValueError("Data not added; quota storage reached.")
 
     def get_json_data(self, infile):
-        """Return the data in JSON format from the given JSON infile.
+        """Return the data in a column store from the given JSON infile.
         If the dataset is new, then define the 'meta' entry contents by
         inspection of the data. Also set the Vega-Lite types.
         If the dataset is being updated, check that the column definitions
@@ -518,31 +564,74 @@ class DatasetSaver(EntitySaver):
                         f"JSON data record {pos}, key '{key}'"
                         f" contains a value of the wrong type: {record}"
                     )
+        data = Columns(meta)
+        data.extend(records)
 
         # Set Vega-Lite types if new dataset.
         if new:
-            self.set_initial_vega_lite_types(records)
-        return records
+            self.set_initial_vega_lite_types(data)
+        return data
 
     def get_csv_data(self, infile):
-        """Return the data in JSON format from the given CSV infile.
+        """Return the data in a column store from the given CSV infile.
         If the dataset is new, then define the 'meta' entry contents by
         inspection of the data. Also set the Vega-Lite types.
         If the dataset is being updated, check against the 'meta' entry.
+        The file is decoded and parsed incrementally; the encoding is
+        detected from a bounded prefix of the file.
         """
-        data = infile.read()
-        detected = chardet.detect(data)
-        data = data.decode(detected["encoding"])
-        reader = csv.DictReader(io.StringIO(data))
-        data = list(reader)
+        infile = getattr(infile, "stream", infile)  # Werkzeug FileStorage.
+        encoding = get_encoding(infile)
+        try:
+            data = self.read_csv(infile, encoding)
+        except UnicodeDecodeError:
+            # Characters beyond the prefix; detect from the whole file.
+            if self._new_meta:
+                self.doc["meta"].clear()
+            infile.seek(0)
+            encoding = get_encoding(infile, full=True)
+            try:
+                data = self.read_csv(infile, encoding)
+            except UnicodeDecodeError:
+                raise ValueError(f"CSV data could not be decoded as {encoding}.")
         if not data:
             raise ValueError("No data in CSV file.")
-        first = data[0]
 
+        # Set Vega-Lite types if new dataset.
+        if self._new_meta:
+            self.set_initial_vega_lite_types(data)
+        return data
+
+    def read_csv(self, infile, encoding):
+        """Return the data in a column store from the CSV infile, decoded
+        incrementally using the given encoding. None if there is no data.
+        """
+        textfile = io.TextIOWrapper(infile, encoding=encoding, newline="")
+        try:
+            data = None
+            for chunk in self.iter_csv_chunks(csv.DictReader(textfile)):
+                if data is None:
+                    data = Columns(self.doc["meta"])
+                data.extend(chunk)
+            return data
+        finally:
+            # Do not let the wrapper close the input file.
+            textfile.detach()
+
+    def iter_csv_chunks(self, reader):
+        """Generate lists of records from the CSV reader, converted and
+        checked with respect to 'meta'. Each list contains at most
+        CSV_CHUNK_SIZE records.
+        """
+        chunk_size = flask.current_app.config["CSV_CHUNK_SIZE"]
         meta = self.doc["meta"]
-        new = not bool(meta)  # New dataset, else being updated.
+        self._new_meta = not bool(meta)  # New dataset, else being updated.
+        try:
+            first = next(reader)
+        except StopIteration:
+            return
 
-        if new:
+        if self._new_meta:
             # Figure out the types from the items in the first data record.
             for key in first:
                 meta[key] = {}
@@ -566,15 +655,21 @@ class DatasetSaver(EntitySaver):
                     raise ValueError(f"CSV data lacks column '{key}'.")
 
         # Convert values; check data homogeneity. Checks with respect to 'meta'.
-        keys = set(meta.keys())
-        for pos, record in enumerate(data, 1):
+        converters = dict(
+            (key, (TYPE_OBJECT_MAP2[m["type"]], m["type"] == "string"))
+            for key, m in meta.items()
+        )
+        chunk = []
+        for pos, record in enumerate(itertools.chain([first], reader), 1):
             for key, value in record.items():
                 # Ignore additional columns in new data.
-                if key not in keys:
+                try:
+                    converter, is_string = converters[key]
+                except KeyError:
                     continue
                 if value:
                     try:
-                        record[key] = TYPE_OBJECT_MAP2[meta[key]["type"]](value)
+                        record[key] = converter(value)
                     except ValueError:
                         # "Not Applicable" means None.
                         if value.lower() in constants.NA_STRINGS:
@@ -585,19 +680,21 @@ class DatasetSaver(EntitySaver):
                                 f" key '{key}' contains a value"
                                 f" of the wrong type: {record}"
                             )
-                elif meta[key]["type"] != "string":
+                elif not is_string:
                     # An empty string is a string when type is 'string'.
                     # Otherwise the value is set as None.
                     record[key] = None
-
-        # Set Vega-Lite types if new dataset.
-        if new:
-            self.set_initial_vega_lite_types(data)
-        return data
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
 
     def set_initial_vega_lite_types(self, data):
         """Set the Vega-Lite types for the data fields as a function of
         the JSON type, except for string where regexp patterns are checked.
+        Null values are disregarded in the check.
         """
         for key, meta in self.doc["meta"].items():
             if meta["type"] in ("integer", "number"):
@@ -611,8 +708,8 @@ class DatasetSaver(EntitySaver):
                     constants.DATETIME_RX,
                     constants.TIME_RX,
                 ):
-                    for record in data:
-                        if not rx.match(record[key]):
+                    for value in data[key]:
+                        if value is not None and not rx.match(value):
                             break
                     else:
                         meta["vega_lite_types"] = ["temporal"]
@@ -621,42 +718,56 @@ class DatasetSaver(EntitySaver):
                     meta["vega_lite_types"] = ["nominal"]
 
     def update_meta(self, data):
-        "Update the 'meta' entry statistics given the data."
+        """Update the 'meta' entry statistics given the data in a column store.
+        Approximate statistics are computed for datasets having more records
+        than META_APPROXIMATE_THRESHOLD. The summary state is stored for
+        datasets having more records than DATASET_MERGE_THRESHOLD, or if
+        the statistics are approximate.
+        """
+        config = flask.current_app.config
+        approximate = len(data) > config["META_APPROXIMATE_THRESHOLD"]
+        mergeable = approximate or len(data) > config["DATASET_MERGE_THRESHOLD"]
+        state = {}
         for key, meta in self.doc["meta"].items():
-            meta["n_null"] = len([r[key] for r in data if r[key] is None])
-            if meta["type"] in ("string", "integer"):
-                distinct = set(r[key] for r in data if r[key] is not None)
-                meta["n_distinct"] = len(distinct)
-                try:
-                    meta["min"] = min(distinct)
-                except ValueError:
-                    meta["min"] = None
-                try:
-                    meta["max"] = max(distinct)
-                except ValueError:
-                    meta["max"] = None
-            if meta["type"] in ("integer", "number"):
-                values = [r[key] for r in data if r[key] is not None]
-                try:
-                    meta["min"] = min(values)
-                except ValueError:
-                    meta["min"] = None
-                try:
-                    meta["max"] = max(values)
-                except ValueError:
-                    meta["max"] = None
-                try:
-                    meta["mean"] = statistics.mean(values)
-                except statistics.StatisticsError:
-                    meta["mean"] = None
-                try:
-                    meta["median"] = statistics.median(values)
-                except statistics.StatisticsError:
-                    meta["median"] = None
-                try:
-                    meta["stdev"] = statistics.stdev(values)
-                except statistics.StatisticsError:
-                    meta["stdev"] = None
+            summary = Summary.from_column(
+                data[key], approximate=approximate, mergeable=mergeable
+            )
+            state[key] = summary.get_state()
+            summary.set_meta(meta)
+        self.set_summary_state(state if mergeable else None)
+
+    def merge_meta(self, data):
+        """Update the 'meta' entry statistics by merging the summaries of
+        the new data in a column store into the stored summary state.
+        The state is computed from the current content if not stored.
+        """
+        if "summary.json" in self.doc["_attachments"]:
+            state = json.load(flask.g.db.get_attachment(self.doc, "summary.json"))
+        else:
+            columns = get_columns(self.doc)
+            state = dict(
+                (key, Summary.from_column(columns[key], approximate=True).get_state())
+                for key in self.doc["meta"]
+            )
+        for key, meta in self.doc["meta"].items():
+            summary = Summary.from_state(state[key])
+            summary.merge(Summary.from_column(data[key], approximate=True))
+            state[key] = summary.get_state()
+            summary.set_meta(meta)
+        self.set_summary_state(state)
+
+    def set_summary_state(self, state):
+        """Store the mergeable summary state of the fields as an attachment,
+        which allows appending data without recomputing the statistics.
+        If None, remove any such attachment.
+        """
+        if state is None:
+            if "summary.json" in self.doc.get("_attachments", {}):
+                self.delete_attachment("summary.json")
+        else:
+            self.add_attachment(
+                "summary.json", json.dumps(state), constants.JSON_MIMETYPE
+            )
 
     def set_vega_lite_types(self, orig_meta=None):
         "Set the Vega-Lite types for the data fields."
@@ -683,44 +794,181 @@ class DatasetSaver(EntitySaver):
         if graphics:
             import datagraphics.graphic
 
-            for graphic in get_graphics(dataset):
+            for graphic in get_graphics(dataset, full=True):
                 with datagraphics.graphic.GraphicSaver() as saver:
                     saver.copy(graphic, dataset=self.doc)
 
 
 # Utility functions
 
+CONTENT_MIMETYPES = {"json": constants.JSON_MIMETYPE, "csv": constants.CSV_MIMETYPE}
+
+# Global cache of content produced on demand.
+_derived_cache = None
+
+
+def get_derived_cache():
+    global _derived_cache
+    if _derived_cache is None:
+        _derived_cache = utils.LruCache(flask.current_app.config["DERIVED_CACHE_SIZE"])
+    return _derived_cache
+
+
+def get_content_response(dataset, ext):
+    """Return a response with the content of the dataset in the format
+    given by the extension. A stored attachment is streamed from CouchDB.
+    Otherwise the content is produced from the JSON content, and kept in
+    the cache of derived content. HTTP Range requests are handled.
+    The ETag is the attachment digest, or the revision for derived content.
+    Raise KeyError if the extension is not a known format.
+    """
+    try:
+        mimetype = CONTENT_MIMETYPES[ext]
+    except KeyError:
+        raise KeyError(f"no such content format '{ext}'")
+    filename = f"data.{ext}"
+    try:
+        etag = dataset["_attachments"][filename]["digest"]
+    except KeyError:
+        etag = f"{dataset['_rev']}-{ext}"
+    # The conditional check is done before fetching any content.
+    response = utils.get_not_modified_response(etag, modified=dataset["modified"])
+    if response is not None:
+        return response
+    if filename in dataset["_attachments"]:
+        response = utils.get_attachment_response(dataset, filename, mimetype)
+    else:
+        key = (dataset["_id"], dataset["_rev"], ext)
+        cache = get_derived_cache()
+        content = cache.get(key)
+        if content is None:
+            content = get_columns(dataset).get_csv()
+            cache.set(key, content)
+        response = flask.Response(content, mimetype=mimetype)
+        response.make_conditional(flask.request, accept_ranges=True)
+    utils.set_validators(response, etag, modified=dataset["modified"])
+    return response
+
+
+def get_query_response(dataset, query):
+    """Return a response with the result of the query on the content of
+    the dataset, as JSON. The result is kept in the cache of derived content.
+    The ETag is given by the revision and the query.
+    """
+    key = query.get_key()
+    etag = f"{dataset['_rev']}-{hashlib.md5(key.encode('utf-8')).hexdigest()}"
+    response = utils.get_not_modified_response(etag, modified=dataset["modified"])
+    if response is not None:
+        return response
+    response = flask.Response(
+        get_query_content(dataset, query), mimetype=constants.JSON_MIMETYPE
+    )
+    utils.set_validators(response, etag, modified=dataset["modified"])
+    return response
+
+
+def get_query_content(dataset, query):
+    """Return the result of the query on the content of the dataset
+    as UTF-8 encoded JSON. It is kept in the cache of derived content.
+    """
+    key = (dataset["_id"], dataset["_rev"], "query", query.get_key())
+    cache = get_derived_cache()
+    content = cache.get(key)
+    if content is None:
+        if dataset.get("_attachments"):
+            result = query.execute(get_columns(dataset))
+        else:
+            result = []
+        content = json.dumps(result, ensure_ascii=False).encode("utf-8")
+        cache.set(key, content)
+    return content
+
+
+def get_content_size(dataset):
+    """Return the total size of the data content of the dataset.
+    The summary state is not content, and is not counted.
+    """
+    return sum(
+        [
+            a["length"]
+            for filename, a in dataset.get("_attachments", {}).items()
+            if filename != "summary.json"
+        ]
+    )
+
+
+def get_columns(dataset):
+    "Return the data content of the dataset in a column store."
+    data = Columns(dataset["meta"])
+    data.extend(json.load(flask.g.db.get_attachment(dataset, "data.json")))
+    return data
+
+
+def get_encoding(infile, full=False):
+    """Detect the character encoding of the file from a bounded prefix,
+    or from the whole file, read in chunks, if 'full' is True.
+    The file position is reset to the start afterwards.
+    """
+    size = flask.current_app.config["CSV_ENCODING_DETECT_SIZE"]
+    if full:
+        detector = chardet.UniversalDetector()
+        while not detector.done:
+            chunk = infile.read(size)
+            if not chunk:
+                break
+            detector.feed(chunk)
+        detector.close()
+        encoding = detector.result["encoding"]
+        # The whole file failed as utf-8; cp1252 is the likely alternative.
+        if not encoding or encoding in ("ascii", "utf-8"):
+            encoding = "cp1252"
+    else:
+        encoding = chardet.detect(infile.read(size))["encoding"]
+        # Pure ASCII prefix; the remainder may contain other characters.
+        if not encoding or encoding == "ascii":
+            encoding = "utf-8"
+    infile.seek(0)
+    return encoding
+
 
 def get_dataset(iuid):
     "Get the dataset given its IUID."
     if not iuid:
         raise ValueError("No IUID given for dataset.")
     try:
-        try:
-            doc = flask.g.cache[iuid]
-        except KeyError:
-            doc = flask.g.db[iuid]
+        doc = utils.get_document(iuid)
     except couchdb2.NotFoundError:
         raise ValueError("No such dataset.")
     if doc.get("doctype") != constants.DOCTYPE_DATASET:
         raise ValueError(f"Database entry {iuid} is not a dataset.")
-    flask.g.cache[iuid] = doc
     return doc
 
 
-def get_graphics(dataset):
-    """Get the graphics entities the dataset is used for.
+def get_graphics(dataset, full=False):
+    """Get the graphics the dataset is used for, sorted by title.
     Exclude those this user is not allowed to view.
+    If full is True, as docs.
+    If full is False, as dictionaries of the fields projected by the view.
     """
     from datagraphics.graphic import allow_view
 
+    view = flask.g.db.view(
+        "graphics",
+        "dataset_owner",
+        startkey=[dataset["_id"], ""],
+        endkey=[dataset["_id"], "ZZZZZZ"],
+        include_docs=full,
+        reduce=False,
+    )
     result = []
-    for row in flask.g.db.view(
-        "graphics", "dataset", key=dataset["_id"], include_docs=True
-    ):
-        if allow_view(row.doc):
-            flask.g.cache[row.doc["_id"]] = row.doc
-            result.append(row.doc)
+    for row in view:
+        if full:
+            graphic = row.doc
+            flask.g.cache[graphic["_id"]] = graphic
+        else:
+            graphic = dict(row.value, _id=row.id)
+        if allow_view(graphic):
+            result.append(graphic)
     return sorted(result, key=lambda g: g["title"])
 
 
@@ -774,16 +1022,22 @@ def allow_delete(dataset):
     return False
 
 
-def possible_delete(dataset):
+def possible_delete(dataset, graphics=None):
     """Is it possible to delete the dataset?
     Not if there is a graphic owned by the same user.
+    If given, check the list of graphics viewable by the current user.
+    Otherwise check for the existence of such a graphic in the view index.
     """
-    for row in flask.g.db.view(
-        "graphics", "dataset", key=dataset["_id"], include_docs=True
-    ):
-        if row.doc["owner"] == dataset["owner"]:
-            return False
-    return True
+    if graphics is not None and allow_delete(dataset):
+        return not any(g["owner"] == dataset["owner"] for g in graphics)
+    view = flask.g.db.view(
+        "graphics",
+        "dataset_owner",
+        key=[dataset["_id"], dataset["owner"]],
+        limit=1,
+        reduce=False,
+    )
+    return len(view) == 0
 
 
 def get_commands(dataset):
@@ -25,8 +25,15 @@ def display():
 @blueprint.route("/public")
 def public():
     "Display list of public datasets."
-    datasets = get_datasets_public(full=True)
-    return flask.render_template("datasets/public.html", datasets=datasets)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        datasets = get_datasets_public(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".public"))
+    return flask.render_template(
+        "datasets/public.html", datasets=datasets, next_url=utils.get_next_url(datasets)
+    )
 
 
 @blueprint.route("/user/<name:username>")
@@ -40,9 +47,18 @@ def user(username):
     if not datagraphics.user.am_admin_or_self(user):
         utils.flash_error("View access to user datasets is not allowed.")
         return flask.redirect(flask.url_for("home"))
-    datasets = get_datasets_owner(username, full=True)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        datasets = get_datasets_owner(username, full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".user", username=username))
     return flask.render_template(
-        "datasets/user.html", user=user, datasets=datasets, show_public=True
+        "datasets/user.html",
+        user=user,
+        datasets=datasets,
+        show_public=True,
+        next_url=utils.get_next_url(datasets),
     )
 
 
@@ -57,9 +73,18 @@ def editor(username):
     if not datagraphics.user.am_admin_or_self(user):
         utils.flash_error("View access to editor datasets is not allowed.")
         return flask.redirect(flask.url_for("home"))
-    datasets = get_datasets_editor(username, full=True)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        datasets = get_datasets_editor(username, full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".editor", username=username))
     return flask.render_template(
-        "datasets/editor.html", user=user, datasets=datasets, show_public=True
+        "datasets/editor.html",
+        user=user,
+        datasets=datasets,
+        show_public=True,
+        next_url=utils.get_next_url(datasets),
     )
 
 
@@ -69,34 +94,37 @@ def all():
     if not flask.g.am_admin:
         utils.flash_error("Not logged in as admin.")
         return flask.redirect(flask.url_for("home"))
-    datasets = get_datasets_all(full=True)
-    return flask.render_template("datasets/all.html", datasets=datasets)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        datasets = get_datasets_all(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".all"))
+    return flask.render_template(
+        "datasets/all.html", datasets=datasets, next_url=utils.get_next_url(datasets)
+    )
 
 
-def get_datasets_owner(username, full=False):
+def get_datasets_owner(username, full=False, cursor=None, limit=None):
     """Get the datasets owned by the given user.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "datasets",
         "owner_modified",
         startkey=(username, "ZZZZZZ"),
         endkey=(username, ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            dataset = row.doc
-            dataset["count_graphics"] = count_graphics(dataset["_id"])
-            flask.g.cache[dataset["_id"]] = dataset
-            result.append(dataset)
-        return result
+        return get_datasets_items(view)
     else:
-        return [(row.id, row.value, row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[1]) for row in view], view.next
+        )
 
 
 def count_datasets_owner(username):
@@ -114,30 +142,34 @@ def count_datasets_owner(username):
         return 0
 
 
-def get_datasets_editor(username, full=False):
+def count_datasets_owners():
+    """Return a dictionary of the number of datasets for all owners.
+    One grouped view query.
+    """
+    view = flask.g.db.view("datasets", "owner_modified", group_level=1)
+    return dict((row.key[0], row.value) for row in view)
+
+
+def get_datasets_editor(username, full=False, cursor=None, limit=None):
     """Get the datasets for which the given user is editor.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "datasets",
         "editor_modified",
         startkey=(username, "ZZZZZZ"),
         endkey=(username, ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            dataset = row.doc
-            dataset["count_graphics"] = count_graphics(dataset["_id"])
-            flask.g.cache[dataset["_id"]] = dataset
-            result.append(dataset)
-        return result
+        return get_datasets_items(view)
     else:
-        return [(row.id, row.value, row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[1]) for row in view], view.next
+        )
 
 
 def count_datasets_editor(username):
@@ -155,31 +187,26 @@ def count_datasets_editor(username):
         return 0
 
 
-def get_datasets_public(full=False, limit=None):
+def get_datasets_public(full=False, cursor=None, limit=None):
     """Get the public datasets.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "datasets",
         "public_modified",
         startkey="ZZZZZZ",
         endkey="",
+        cursor=cursor,
         limit=limit,
-        include_docs=full,
-        reduce=False,
-        descending=True,
     )
     if full:
-        result = []
-        for row in view:
-            dataset = row.doc
-            dataset["count_graphics"] = count_graphics(dataset["_id"])
-            flask.g.cache[dataset["_id"]] = dataset
-            result.append(dataset)
-        return result
+        return get_datasets_items(view)
     else:
-        return [(row.id, row.value, row.key) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key) for row in view], view.next
+        )
 
 
 def count_datasets_public():
@@ -192,30 +219,27 @@ def count_datasets_public():
         return 0
 
 
-def get_datasets_all(full=False):
+def get_datasets_all(full=False, cursor=None, limit=None):
     """Get all datasets.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, owner, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "datasets",
         "owner_modified",
         startkey=("ZZZZZZ", "ZZZZZZ"),
         endkey=("", ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            dataset = row.doc
-            dataset["count_graphics"] = count_graphics(dataset["_id"])
-            flask.g.cache[dataset["_id"]] = dataset
-            result.append(dataset)
-        return result
+        return get_datasets_items(view)
     else:
-        return [(row.id, row.value, row.key[0], row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[0], row.key[1]) for row in view],
+            view.next,
+        )
 
 
 def count_datasets_all():
@@ -226,10 +250,43 @@ def count_datasets_all():
         return 0
 
 
-def count_graphics(dataset_iuid):
-    "Return the number of graphics for the dataset given by its iuid."
-    view = flask.g.db.view("graphics", "dataset", key=dataset_iuid, reduce=True)
-    try:
-        return list(view)[0].value
-    except IndexError:
-        return 0
+def count_graphics_datasets(dataset_iuids):
+    """Return a dictionary of the number of graphics for the datasets
+    given by their iuids. One grouped view query.
+    """
+    result = dict((iuid, 0) for iuid in dataset_iuids)
+    view = utils.get_view_rows("graphics", "dataset", list(result), group=True)
+    for row in view:
+        result[row.key] = row.value
+    return result
+
+
+def get_datasets_access(dataset_iuids):
+    """Return a dictionary of the datasets given by their iuids, as
+    dictionaries of the fields needed to link to them and to check access.
+    Those in the per-request cache are used as is; the others are fetched
+    by one view query. Missing ones are skipped.
+    """
+    result = {}
+    iuids = []
+    for iuid in set(dataset_iuids):
+        if not iuid:
+            continue
+        try:
+            result[iuid] = flask.g.cache[iuid]
+        except KeyError:
+            iuids.append(iuid)
+    for row in utils.get_view_rows("datasets", "access", iuids):
+        result[row.id] = dict(row.value, _id=row.id)
+    return result
+
+
+def get_datasets_items(view):
+    """Return the datasets from the rows of the list view query,
+    as dictionaries with the number of graphics set for each.
+    """
+    result = [dict(row.value, _id=row.id) for row in view]
+    counts = count_graphics_datasets([dataset["_id"] for dataset in result])
+    for dataset in result:
+        dataset["count_graphics"] = counts[dataset["_id"]]
+    return utils.Page(result, view.next)
@@ -1,6 +1,8 @@
 "Graphic to display dataset."
 
 from copy import deepcopy
+import hashlib
+import http.client
 import json
 
 import couchdb2
@@ -10,36 +12,34 @@ import jsonschema
 import datagraphics.dataset
 import datagraphics.user
 from datagraphics import constants
+from datagraphics import render
 from datagraphics import utils
+from datagraphics.pushdown import get_pushdown, get_query_args
+from datagraphics.query import Query
 from datagraphics.saver import EntitySaver
 
-
-def init(app):
-    "Initialize; update CouchDB design document."
-    db = utils.get_db(app=app)
-    logger = utils.get_logger(app)
-    if db.put_design("graphics", DESIGN_DOC):
-        logger.info("Updated graphics design document.")
-
-
 DESIGN_DOC = {
     "views": {
         "public_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'graphic' || !doc.public) return; emit(doc.modified, doc.title);}",
+            "map": "function(doc) {if (doc.doctype !== 'graphic' || !doc.public) return; emit(doc.modified, {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'dataset': doc.dataset, 'error': Boolean(doc.error)});}",
         },
         "owner_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'graphic') return; emit([doc.owner, doc.modified], doc.title);}",
+            "map": "function(doc) {if (doc.doctype !== 'graphic') return; emit([doc.owner, doc.modified], {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'dataset': doc.dataset, 'error': Boolean(doc.error)});}",
         },
         "editor_modified": {
             "reduce": "_count",
-            "map": "function(doc) {if (doc.doctype !== 'graphic') return; if (!doc.editors) return; for (var i=0; i<doc.editors.length; i++) { emit([doc.editors[i], doc.modified], doc.title);}}",
+            "map": "function(doc) {if (doc.doctype !== 'graphic') return; if (!doc.editors) return; for (var i=0; i<doc.editors.length; i++) { emit([doc.editors[i], doc.modified], {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'modified': doc.modified, 'dataset': doc.dataset, 'error': Boolean(doc.error)});}}",
         },
         "dataset": {
             "reduce": "_count",
             "map": "function(doc) {if (doc.doctype !== 'graphic') return; emit(doc.dataset, doc.title);}",
         },
+        "dataset_owner": {
+            "reduce": "_count",
+            "map": "function(doc) {if (doc.doctype !== 'graphic') return; emit([doc.dataset, doc.owner], {'title': doc.title, 'owner': doc.owner, 'public': Boolean(doc.public), 'editors': doc.editors || [], 'modified': doc.modified});}",
+        },
     }
 }
 
@@ -122,9 +122,14 @@ def display(iuid):
             " This graphic may become invalid if the owner of"
             " the dataset deletes it or makes it inaccessible."
         )
+    if dataset:
+        specification = get_served_specification(graphic, dataset)[0]
+    else:
+        specification = graphic["specification"]
     return flask.render_template(
         "graphic/display.html",
         graphic=graphic,
+        specification=specification,
         slug=utils.slugify(graphic["title"]),
         dataset=dataset,
         other_graphics=other_graphics,
@@ -174,7 +179,7 @@ def edit(iuid):
         if not allow_delete(graphic):
             utils.flash_error("Delete access to graphic not allowed.")
             return flask.redirect(flask.url_for(".display", iuid=iuid))
-        flask.g.db.delete(graphic)
+        utils.delete_document(graphic)
         for log in utils.get_logs(graphic["_id"], cleanup=False):
             flask.g.db.delete(log)
         utils.flash_message("The graphic was deleted.")
@@ -254,13 +259,22 @@ def download(iuid, ext):
         utils.flash_error("View access to dataset not allowed.")
         return flask.redirect(utils.url_referrer())
 
-    spec = graphic["specification"]
+    spec, query = get_served_specification(graphic, dataset)
     slug = utils.slugify(graphic["title"])
     id = flask.request.args.get("id") or "graphic"
-
-    if utils.to_bool(flask.request.args.get("inline")):
-        outfile = flask.g.db.get_attachment(dataset, "data.json")
-        spec["data"] = {"values": json.load(outfile)}
+    inline = utils.to_bool(flask.request.args.get("inline"))
+
+    # The output is determined by the revisions and the request arguments.
+    etag = hashlib.md5(
+        f"{graphic['_rev']} {dataset['_rev']} {ext} {id} {inline}".encode("utf-8")
+    ).hexdigest()
+    modified = max(graphic["modified"], dataset["modified"])
+    response = utils.get_not_modified_response(etag, modified=modified)
+    if response is not None:
+        return response
+
+    if inline:
+        set_inline_data(spec, dataset, query)
     if ext == "json":
         response = flask.jsonify(spec)
         response.headers.set("Content-Type", constants.JSON_MIMETYPE)
@@ -279,10 +293,52 @@ def download(iuid, ext):
         )
         response = flask.make_response(html)
         response.headers.set("Content-Type", constants.HTML_MIMETYPE)
+    elif ext in render.RENDER_MIMETYPES:
+        if not render.is_available():
+            flask.abort(http.client.NOT_FOUND)
+        try:
+            content = get_rendered(graphic, dataset, ext)
+        except ValueError as error:
+            utils.flash_error(str(error))
+            return flask.redirect(utils.url_referrer())
+        response = flask.make_response(content)
+        response.headers.set("Content-Type", render.RENDER_MIMETYPES[ext])
     else:
         utils.flash_error("Invalid file type requested.")
         return flask.redirect(utils.url_referrer())
     response.headers.set("Content-Disposition", "attachment", filename=f"{slug}.{ext}")
+    utils.set_validators(response, etag, modified=modified)
+    return response
+
+
+@blueprint.route("/<iuid:iuid>/thumbnail")
+def thumbnail(iuid):
+    """Return a thumbnail PNG image of the graphic, from the disk cache.
+    If not there, it is rendered in the background, and 404 is returned.
+    """
+    if not render.thumbnails_available():
+        flask.abort(http.client.NOT_FOUND)
+    try:
+        graphic = get_graphic(iuid)
+    except ValueError as error:
+        flask.abort(http.client.NOT_FOUND)
+    if not allow_view(graphic):
+        flask.abort(http.client.FORBIDDEN)
+    dataset = get_dataset(graphic)
+    if not dataset:
+        flask.abort(http.client.FORBIDDEN)
+    etag = f"{graphic['_rev']}-{dataset['_rev']}-thumbnail"
+    modified = max(graphic["modified"], dataset["modified"])
+    response = utils.get_not_modified_response(etag, modified=modified)
+    if response is not None:
+        return response
+    key = get_rendered_key(graphic, dataset, "png", thumbnail=True)
+    content = render.get_file_cache().get(key)
+    if content is None:
+        render_thumbnail(graphic, dataset)
+        flask.abort(http.client.NOT_FOUND)
+    response = flask.Response(content, mimetype=constants.PNG_MIMETYPE)
+    utils.set_validators(response, etag, modified=modified)
     return response
 
 
@@ -552,15 +608,11 @@ def get_graphic(iuid):
     if not iuid:
         raise ValueError("No IUID given for graphic.")
     try:
-        try:
-            doc = flask.g.cache[iuid]
-        except KeyError:
-            doc = flask.g.db[iuid]
+        doc = utils.get_document(iuid)
     except couchdb2.NotFoundError:
         raise ValueError("No such graphic.")
     if doc.get("doctype") != constants.DOCTYPE_GRAPHIC:
         raise ValueError(f"Database entry {iuid} is not a graphic.")
-    flask.g.cache[iuid] = doc
     return doc
 
 
@@ -612,6 +664,123 @@ def allow_delete(graphic):
     return False
 
 
+def get_served_specification(graphic, dataset):
+    """Return the specification to serve for the graphic, and the query
+    for its data, if any. For a large dataset, the aggregates and bins
+    in a simple specification are computed by the dataset query resource,
+    so that only their result is transferred to the client.
+    The stored specification is not changed, and is served as is if it
+    is invalid or cannot be pushed down.
+    """
+    specification = graphic["specification"]
+    if graphic.get("error"):
+        return specification, None
+    threshold = flask.current_app.config["VEGA_LITE_PUSHDOWN_RECORDS"]
+    if not threshold or (dataset.get("n_records") or 0) < threshold:
+        return specification, None
+    pushdown = get_pushdown(specification, dataset["meta"])
+    if pushdown is None:
+        return specification, None
+    spec, specification = pushdown
+    if specification["data"].get("url") not in get_dataset_urls(dataset):
+        return graphic["specification"], None
+    try:
+        query = Query(spec, dataset["meta"])
+    except ValueError:
+        return graphic["specification"], None
+    specification["data"] = {
+        "url": flask.url_for(
+            "api_dataset.query",
+            iuid=dataset["_id"],
+            _external=True,
+            **get_query_args(spec),
+        ),
+        "format": {"type": "json"},
+    }
+    return specification, query
+
+
+def set_inline_data(specification, dataset, query=None):
+    """Set the data of the specification to the values of the content
+    of the dataset, or to the result of the query on it, if given.
+    """
+    if query is None:
+        outfile = flask.g.db.get_attachment(dataset, "data.json")
+        specification["data"] = {"values": json.load(outfile)}
+    else:
+        content = datagraphics.dataset.get_query_content(dataset, query)
+        specification["data"] = {"values": json.loads(content)}
+
+
+def get_rendered(graphic, dataset, format, thumbnail=False):
+    """Return the graphic rendered on the server in the given format,
+    from the disk cache if there. The rendered content is determined
+    by the revisions of the graphic and its dataset.
+    Raise ValueError if it could not be rendered.
+    """
+    key = get_rendered_key(graphic, dataset, format, thumbnail=thumbnail)
+    cache = render.get_file_cache()
+    if cache is not None:
+        content = cache.get(key)
+        if content is not None:
+            return content
+    if thumbnail:
+        scale = flask.current_app.config["RENDER_THUMBNAIL_SCALE"]
+    else:
+        scale = 1
+    specification, query = get_served_specification(graphic, dataset)
+    specification = deepcopy(specification)
+    set_inline_data(specification, dataset, query)
+    content = render.render(specification, format, scale=scale)
+    if cache is not None:
+        cache.set(key, content)
+    return content
+
+
+def get_rendered_key(graphic, dataset, format, thumbnail=False):
+    "Return the disk cache key for the rendered graphic."
+    if thumbnail:
+        return f"{graphic['_id']}-{graphic['_rev']}-{dataset['_rev']}-thumbnail.png"
+    else:
+        return f"{graphic['_id']}-{graphic['_rev']}-{dataset['_rev']}.{format}"
+
+
+def render_thumbnail(graphic, dataset):
+    """Render the thumbnail of the graphic into the disk cache in the
+    background thread, unless already queued for these revisions.
+    """
+    app = flask.current_app._get_current_object()
+    url_root = flask.request.url_root
+    graphic = deepcopy(graphic)
+    dataset = deepcopy(dataset)
+
+    def task():
+        # The request context is needed for the URLs in the specification.
+        with app.test_request_context(base_url=url_root):
+            flask.g.db = utils.get_db()
+            flask.g.cache = {}
+            try:
+                get_rendered(graphic, dataset, "png", thumbnail=True)
+            except (ValueError, couchdb2.CouchDB2Exception) as error:
+                utils.get_logger().warning(
+                    f"Could not render thumbnail of graphic {graphic['_id']}: {error}"
+                )
+
+    render.submit(get_rendered_key(graphic, dataset, "png", thumbnail=True), task)
+
+
+def get_dataset_urls(dataset):
+    "Return the URLs of the content of the dataset."
+    return set(
+        [
+            flask.url_for(
+                "api_dataset.content", iuid=dataset["_id"], ext=ext, _external=True
+            )
+            for ext in ("csv", "json")
+        ]
+    )
+
+
 def get_dataset(graphic):
     "Get the dataset for the graphic, if allowed. Else None."
     try:
@@ -2,6 +2,8 @@
 
 import flask
 
+import datagraphics.dataset
+import datagraphics.datasets
 import datagraphics.graphic
 import datagraphics.user
 
@@ -25,8 +27,15 @@ def display():
 @blueprint.route("/public")
 def public():
     "Display list of public graphics."
-    graphics = get_graphics_public(full=True)
-    return flask.render_template("graphics/public.html", graphics=graphics)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        graphics = get_graphics_public(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".public"))
+    return flask.render_template(
+        "graphics/public.html", graphics=graphics, next_url=utils.get_next_url(graphics)
+    )
 
 
 @blueprint.route("/user/<name:username>")
@@ -40,9 +49,18 @@ def user(username):
     if not datagraphics.user.am_admin_or_self(user):
         utils.flash_error("View access to user is not allowed.")
         return flask.redirect(flask.url_for("home"))
-    graphics = get_graphics_owner(username, full=True)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        graphics = get_graphics_owner(username, full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".user", username=username))
     return flask.render_template(
-        "graphics/user.html", user=user, graphics=graphics, show_public=True
+        "graphics/user.html",
+        user=user,
+        graphics=graphics,
+        show_public=True,
+        next_url=utils.get_next_url(graphics),
     )
 
 
@@ -57,9 +75,18 @@ def editor(username):
     if not datagraphics.user.am_admin_or_self(user):
         utils.flash_error("View access to editor graphics is not allowed.")
         return flask.redirect(flask.url_for("home"))
-    graphics = get_graphics_editor(username, full=True)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        graphics = get_graphics_editor(username, full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".editor", username=username))
     return flask.render_template(
-        "graphics/editor.html", user=user, graphics=graphics, show_public=True
+        "graphics/editor.html",
+        user=user,
+        graphics=graphics,
+        show_public=True,
+        next_url=utils.get_next_url(graphics),
     )
 
 
@@ -69,34 +96,37 @@ def all():
     if not flask.g.am_admin:
         utils.flash_error("Not logged in as admin.")
         return flask.redirect(flask.url_for("home"))
-    graphics = get_graphics_all(full=True)
-    return flask.render_template("graphics/all.html", graphics=graphics)
+    try:
+        cursor, limit = utils.get_paging(paged=True)
+        graphics = get_graphics_all(full=True, cursor=cursor, limit=limit)
+    except ValueError as error:
+        utils.flash_error(str(error))
+        return flask.redirect(flask.url_for(".all"))
+    return flask.render_template(
+        "graphics/all.html", graphics=graphics, next_url=utils.get_next_url(graphics)
+    )
 
 
-def get_graphics_owner(username, full=False):
+def get_graphics_owner(username, full=False, cursor=None, limit=None):
     """Get the graphics owned by the given user.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "graphics",
         "owner_modified",
         startkey=(username, "ZZZZZZ"),
         endkey=(username, ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            graphic = row.doc
-            fetch_dataset(graphic)
-            flask.g.cache[graphic["_id"]] = graphic
-            result.append(graphic)
-        return result
+        return get_graphics_items(view)
     else:
-        return [(row.id, row.value, row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[1]) for row in view], view.next
+        )
 
 
 def count_graphics_owner(username):
@@ -115,30 +145,34 @@ def count_graphics_owner(username):
         return 0
 
 
-def get_graphics_editor(username, full=False):
+def get_graphics_editor(username, full=False, cursor=None, limit=None):
     """Get the graphics for which the given user is editor.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "graphics",
         "editor_modified",
         startkey=(username, "ZZZZZZ"),
         endkey=(username, ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            graphic = row.doc
-            fetch_dataset(graphic)
-            flask.g.cache[graphic["_id"]] = graphic
-            result.append(graphic)
-        return result
+        return get_graphics_items(view)
     else:
-        return [(row.id, row.value, row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[1]) for row in view], view.next
+        )
+
+
+def count_graphics_owners():
+    """Return a dictionary of the number of graphics for all owners.
+    One grouped view query.
+    """
+    view = flask.g.db.view("graphics", "owner_modified", group_level=1)
+    return dict((row.key[0], row.value) for row in view)
 
 
 def count_graphics_editor(username):
@@ -157,31 +191,26 @@ def count_graphics_editor(username):
         return 0
 
 
-def get_graphics_public(full=False, limit=None):
+def get_graphics_public(full=False, cursor=None, limit=None):
     """Get the public graphics.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "graphics",
         "public_modified",
         startkey="ZZZZZZ",
         endkey="",
+        cursor=cursor,
         limit=limit,
-        include_docs=full,
-        reduce=False,
-        descending=True,
     )
     if full:
-        result = []
-        for row in view:
-            graphic = row.doc
-            fetch_dataset(graphic)
-            flask.g.cache[graphic["_id"]] = graphic
-            result.append(graphic)
-        return result
+        return get_graphics_items(view)
     else:
-        return [(row.id, row.value, row.key) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key) for row in view], view.next
+        )
 
 
 def count_graphics_public():
@@ -194,30 +223,27 @@ def count_graphics_public():
         return 0
 
 
-def get_graphics_all(full=False):
+def get_graphics_all(full=False, cursor=None, limit=None):
     """Get all graphics.
-    If full is True, as docs.
+    If full is True, as dictionaries of the fields projected by the view.
     If full is False, as list of tuples (iuid, title, owner, modified).
+    Return a page of at most 'limit' items, starting at the cursor if given.
     """
-    view = flask.g.db.view(
+    view = utils.get_view_page(
         "graphics",
         "owner_modified",
         startkey=("ZZZZZZ", "ZZZZZZ"),
         endkey=("", ""),
-        include_docs=full,
-        reduce=False,
-        descending=True,
+        cursor=cursor,
+        limit=limit,
     )
     if full:
-        result = []
-        for row in view:
-            graphic = row.doc
-            fetch_dataset(graphic)
-            flask.g.cache[graphic["_id"]] = graphic
-            result.append(graphic)
-        return result
+        return get_graphics_items(view)
     else:
-        return [(row.id, row.value, row.key[0], row.key[1]) for row in view]
+        return utils.Page(
+            [(row.id, row.value["title"], row.key[0], row.key[1]) for row in view],
+            view.next,
+        )
 
 
 def count_graphics_all():
@@ -230,10 +256,18 @@ def count_graphics_all():
         return 0
 
 
-def fetch_dataset(graphic):
-    "Set the dataset in the graphic to the instance, if possible."
-    dataset = datagraphics.graphic.get_dataset(graphic)
-    if dataset is not None:
-        if not datagraphics.dataset.allow_view(dataset):
+def get_graphics_items(view):
+    """Return the graphics from the rows of the list view query,
+    as dictionaries with the dataset set for each, if allowed to view.
+    The datasets are fetched in one go.
+    """
+    result = [dict(row.value, _id=row.id) for row in view]
+    datasets = datagraphics.datasets.get_datasets_access(
+        [graphic.get("dataset") for graphic in result]
+    )
+    for graphic in result:
+        dataset = datasets.get(graphic.get("dataset"))
+        if dataset is not None and not datagraphics.dataset.allow_view(dataset):
             dataset = None
-    graphic["dataset"] = dataset
+        graphic["dataset"] = dataset
+    return utils.Page(result, view.next)
@@ -1,5 +1,8 @@
 "DataGraphics: Serve data and graphics on the web using Vega-Lite graphics."
 
+import http.client
+
+import couchdb2
 import flask
 import markupsafe
 
@@ -9,6 +12,7 @@ import datagraphics.dataset
 import datagraphics.datasets
 import datagraphics.graphic
 import datagraphics.graphics
+import datagraphics.render
 import datagraphics.user
 
 import datagraphics.api.about
@@ -26,6 +30,15 @@ from datagraphics import utils
 
 
 app = datagraphics.config.create_app(__name__)
+app.add_template_global(datagraphics.render.is_available, name="render_available")
+app.add_template_global(
+    datagraphics.render.thumbnails_available, name="thumbnails_available"
+)
+if not datagraphics.render.is_available():
+    utils.get_logger(app).warning(
+        "Package 'vl-convert-python' is not installed;"
+        " no server-side rendering or thumbnails of graphics."
+    )
 
 
 class JsonException(Exception):
@@ -54,6 +67,18 @@ def handle_json_exception(error):
     return response
 
 
+@app.errorhandler(couchdb2.RevisionError)
+def handle_revision_error(error):
+    """The document was changed by someone else during the request.
+    Return a conflict response for the API, else redirect back to the page.
+    """
+    message = "The item was modified by someone else; please try again."
+    if flask.request.path.startswith("/api/"):
+        return message, http.client.CONFLICT
+    utils.flash_error(message)
+    return flask.redirect(utils.url_referrer())
+
+
 @app.context_processor
 def setup_template_context():
     "Add useful stuff to the global context of Jinja2 templates."
@@ -72,6 +97,7 @@ def prepare():
     flask.g.timer = utils.Timer()
     flask.g.db = utils.get_db()
     flask.g.cache = {}  # key: iuid, value: document
+    flask.g.log_entries = []  # Written after the response, if LOG_WRITE_BEHIND.
     flask.g.current_user = datagraphics.user.get_current_user()
     flask.g.am_admin = (
         flask.g.current_user and flask.g.current_user["role"] == constants.ADMIN
@@ -79,6 +105,8 @@ def prepare():
 
 
 app.after_request(utils.log_access)
+app.after_request(utils.flush_log_entries)
+app.teardown_request(utils.flush_log_entries_remaining)
 
 
 @app.route("/")
@@ -117,7 +145,10 @@ def debug():
 @app.route("/documentation")
 def documentation():
     "Documentation page; the prepocessed file 'documentation.md'."
-    return flask.render_template("documentation.html")
+    toc, documentation = utils.get_documentation()
+    return flask.render_template(
+        "documentation.html", toc=toc, documentation=documentation
+    )
 
 
 @app.route("/status")
@@ -0,0 +1,147 @@
+"Push down the aggregation in a Vega-Lite specification to a dataset query."
+
+import copy
+
+from datagraphics.query import (
+    AGGREGATE_OPERATIONS,
+    DEFAULT_MAXBINS,
+    NUMERICAL_OPERATIONS,
+)
+
+# The encoding channels that may be pushed down.
+CHANNELS = ("x", "y", "color", "size", "shape", "opacity", "row", "column")
+
+# The secondary channels for binned positional channels.
+SECONDARY_CHANNELS = {"x": "x2", "y": "y2"}
+
+# The top-level items of a single-view specification that are not affected.
+ALLOWED_ITEMS = set(
+    [
+        "$schema",
+        "title",
+        "description",
+        "name",
+        "width",
+        "height",
+        "autosize",
+        "background",
+        "padding",
+        "config",
+        "mark",
+        "encoding",
+        "data",
+    ]
+)
+
+
+def get_pushdown(specification, meta):
+    """Return the query spec for the aggregation in the Vega-Lite
+    specification, and a copy of the specification rewritten to use the
+    result of that query, with the data item to be set by the caller.
+    Return None if the specification cannot be pushed down; only simple
+    single-view specifications with aggregates and bins are handled.
+    """
+    if not set(specification).issubset(ALLOWED_ITEMS):
+        return None
+    if not isinstance(specification.get("encoding"), dict):
+        return None
+    if set(specification["encoding"]).difference(CHANNELS):
+        return None
+    data = specification.get("data")
+    if not isinstance(data, dict) or not set(data).issubset(["url", "format"]):
+        return None
+    groupby = []
+    aggregate = []
+    bins = []
+    encoding = {}
+    for channel, definition in specification["encoding"].items():
+        if not isinstance(definition, dict):
+            return None
+        definition = copy.deepcopy(definition)
+        if isinstance(definition.get("sort"), dict):
+            return None
+        if "timeUnit" in definition:
+            return None
+        field = definition.get("field")
+        if field is not None and (not isinstance(field, str) or field not in meta):
+            return None
+        # Such characters would be ambiguous in the query arguments.
+        if field and (":" in field or "," in field):
+            return None
+        if "aggregate" in definition:
+            op = definition.pop("aggregate")
+            if not isinstance(op, str) or op not in AGGREGATE_OPERATIONS:
+                return None
+            if "bin" in definition:
+                return None
+            if field is None and AGGREGATE_OPERATIONS[op]:
+                return None
+            # The query would fail; Vega handles this on the client.
+            if op in NUMERICAL_OPERATIONS and (
+                field is None or meta[field]["type"] not in ("integer", "number")
+            ):
+                return None
+            name = f"{op}_{field}" if field else op
+            aggregate.append({"op": op, "field": field, "as": name})
+            definition["field"] = name
+            definition["type"] = "quantitative"
+            definition.setdefault("title", get_title(op, field))
+        elif "bin" in definition:
+            bin = definition.pop("bin")
+            if bin is True:
+                maxbins = DEFAULT_MAXBINS
+            elif isinstance(bin, dict) and set(bin).issubset(["maxbins"]):
+                maxbins = bin.get("maxbins", DEFAULT_MAXBINS)
+            else:
+                return None
+            # Bool is a subclass of int, but not a valid maxbins.
+            if not isinstance(maxbins, int) or isinstance(maxbins, bool):
+                return None
+            if maxbins < 2:
+                return None
+            try:
+                secondary = SECONDARY_CHANNELS[channel]
+            except KeyError:
+                return None
+            if field is None or meta[field]["type"] not in ("integer", "number"):
+                return None
+            bins.append({"field": field, "maxbins": maxbins})
+            definition["field"] = f"bin_{field}"
+            definition["bin"] = {"binned": True}
+            definition.setdefault("title", f"{field} (binned)")
+            encoding[secondary] = {"field": f"bin_{field}_end"}
+        elif field is not None:
+            groupby.append(field)
+        elif "value" not in definition and "datum" not in definition:
+            return None
+        encoding[channel] = definition
+    if not aggregate:
+        return None
+    result = copy.deepcopy(specification)
+    result["encoding"] = encoding
+    query = {
+        "groupby": sorted(set(groupby)),
+        "aggregate": aggregate,
+        "bin": bins,
+    }
+    return query, result
+
+
+def get_title(op, field):
+    "Return the title for the aggregate, as Vega-Lite would by default."
+    if op == "count":
+        return "Count of Records"
+    return f"{op.capitalize()} of {field}"
+
+
+def get_query_args(query):
+    "Return the request arguments for the query resource given the query spec."
+    args = {}
+    if query["groupby"]:
+        args["groupby"] = ",".join(query["groupby"])
+    args["aggregate"] = [
+        ":".join([a["op"], a["field"] or "", a["as"]]) for a in query["aggregate"]
+    ]
+    if query["bin"]:
+        args["bin"] = [f"{b['field']}:{b['maxbins']}" for b in query["bin"]]
+    return args
@@ -0,0 +1,301 @@
+"Query of the content of a dataset: projection, filter, binning, aggregate."
+
+import json
+import math
+import operator
+
+from datagraphics.summary import get_median
+
+FILTER_OPERATORS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "le": operator.le,
+    "gt": operator.gt,
+    "ge": operator.ge,
+}
+
+# Aggregate operations, named as in Vega-Lite, and whether a field is required.
+AGGREGATE_OPERATIONS = {
+    "count": False,
+    "valid": True,
+    "missing": True,
+    "distinct": True,
+    "sum": True,
+    "mean": True,
+    "average": True,
+    "median": True,
+    "min": True,
+    "max": True,
+    "variance": True,
+    "stdev": True,
+}
+
+# Aggregate operations that require a numerical field.
+NUMERICAL_OPERATIONS = set(["sum", "mean", "average", "median", "variance", "stdev"])
+
+# Default maximum number of bins, as in Vega-Lite.
+DEFAULT_MAXBINS = 10
+
+
+class Query:
+    """Query of the records of a dataset, checked against its 'meta'.
+    The spec is a dictionary with any of the items:
+    'fields': list of the fields to output; default all.
+      Ignored if 'groupby', 'aggregate' or 'bin' is given.
+    'filter': list of [field, operator, value]; all must be true.
+      Operators are 'eq', 'ne', 'lt', 'le', 'gt', 'ge'. Null never matches.
+    'bin': list of {'field': field, 'maxbins': n}. Adds the fields
+      'bin_{field}' and 'bin_{field}_end' with the bin boundaries.
+    'groupby': list of fields to group by, in addition to the bins.
+    'aggregate': list of {'op': op, 'field': field, 'as': name}.
+      The name defaults to '{op}_{field}', or 'count' if no field.
+    Raise ValueError if the spec is invalid.
+    """
+
+    def __init__(self, spec, meta):
+        self.meta = meta
+        self.fields = [self.check_field(f) for f in spec.get("fields") or []]
+        self.filters = []
+        for item in spec.get("filter") or []:
+            try:
+                field, op, value = item
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid filter '{item}'")
+            self.check_field(field)
+            if op not in FILTER_OPERATORS:
+                raise ValueError(f"invalid filter operator '{op}'")
+            self.filters.append((field, op, self.convert(field, value)))
+        self.bins = []
+        for item in spec.get("bin") or []:
+            field = self.check_field(item.get("field"))
+            if meta[field]["type"] not in ("integer", "number"):
+                raise ValueError(f"cannot bin non-numerical field '{field}'")
+            try:
+                maxbins = int(item.get("maxbins") or DEFAULT_MAXBINS)
+                if maxbins < 2:
+                    raise ValueError
+            except (TypeError, ValueError):
+                raise ValueError(f"invalid maxbins for bin of field '{field}'")
+            self.bins.append({"field": field, "maxbins": maxbins})
+        self.groupby = [self.check_field(f) for f in spec.get("groupby") or []]
+        self.aggregates = []
+        for item in spec.get("aggregate") or []:
+            op = item.get("op")
+            try:
+                needs_field = AGGREGATE_OPERATIONS[op]
+            except KeyError:
+                raise ValueError(f"invalid aggregate operation '{op}'")
+            field = item.get("field")
+            if field:
+                self.check_field(field)
+                numerical = meta[field]["type"] in ("integer", "number")
+                if op in NUMERICAL_OPERATIONS and not numerical:
+                    raise ValueError(f"cannot {op} non-numerical field '{field}'")
+            elif needs_field:
+                raise ValueError(f"aggregate operation '{op}' requires a field")
+            name = item.get("as") or (f"{op}_{field}" if field else op)
+            self.aggregates.append({"op": op, "field": field, "as": name})
+
+    def check_field(self, field):
+        "Return the field if it is in the dataset. Else raise ValueError."
+        if field not in self.meta:
+            raise ValueError(f"no such field '{field}'")
+        return field
+
+    def convert(self, field, value):
+        "Convert the filter value to the type of the field."
+        type = self.meta[field]["type"]
+        try:
+            if type == "integer":
+                return int(value)
+            elif type == "number":
+                return float(value)
+            elif type == "boolean":
+                if isinstance(value, bool):
+                    return value
+                return {"true": True, "false": False}[str(value).lower()]
+            else:
+                return str(value)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"invalid value '{value}' for field '{field}'")
+
+    def get_key(self):
+        "Return a canonical string representation of the query."
+        return json.dumps(
+            {
+                "fields": self.fields,
+                "filter": self.filters,
+                "bin": self.bins,
+                "groupby": self.groupby,
+                "aggregate": self.aggregates,
+            },
+            sort_keys=True,
+        )
+
+    def execute(self, columns):
+        """Execute the query on the column store 'Columns' of the dataset.
+        Return a list of records as dictionaries. Groups are in the order
+        of their first occurrence.
+        """
+        rows = range(len(columns))
+        for field, op, value in self.filters:
+            compare = FILTER_OPERATORS[op]
+            values = list(columns[field])
+            rows = [
+                row
+                for row in rows
+                if values[row] is not None and compare(values[row], value)
+            ]
+        n_rows = len(rows)
+        if n_rows == len(columns):
+            rows = None
+
+        def get_values(field):
+            "Return the values of the field for the selected rows."
+            values = list(columns[field])
+            if rows is None:
+                return values
+            return [values[row] for row in rows]
+
+        if not (self.aggregates or self.groupby or self.bins):
+            keys = self.fields or columns.keys
+            values = [get_values(key) for key in keys]
+            return [dict(zip(keys, record)) for record in zip(*values)]
+
+        # The bins are computed from the extent of the selected values.
+        keys = []
+        key_values = []
+        for item in self.bins:
+            field = item["field"]
+            keys.extend([f"bin_{field}", f"bin_{field}_end"])
+            key_values.extend(bin_values(get_values(field), item["maxbins"]))
+        for field in self.groupby:
+            keys.append(field)
+            key_values.append(get_values(field))
+        groups = {}
+        for pos, group in enumerate(zip(*key_values)):
+            groups.setdefault(group, []).append(pos)
+        # Without groups, there is one record, even if no rows were selected.
+        if not keys:
+            groups[()] = list(range(n_rows))
+        # Without aggregates, the distinct combinations of values are output.
+        values = {}
+        for item in self.aggregates:
+            if item["field"] and item["field"] not in values:
+                values[item["field"]] = get_values(item["field"])
+        result = []
+        for group, positions in groups.items():
+            record = dict(zip(keys, group))
+            for item in self.aggregates:
+                if item["field"]:
+                    data = [values[item["field"]][pos] for pos in positions]
+                else:
+                    data = positions
+                record[item["as"]] = aggregate(item["op"], data)
+            result.append(record)
+        return result
+
+
+def aggregate(op, values):
+    "Return the result of the aggregate operation on the values."
+    if op == "count":
+        return len(values)
+    if op == "missing":
+        return values.count(None)
+    values = [v for v in values if v is not None]
+    if op == "valid":
+        return len(values)
+    if op == "distinct":
+        return len(set(values))
+    if not values:
+        return None
+    if op == "min":
+        return min(values)
+    if op == "max":
+        return max(values)
+    if op == "sum":
+        return sum(values)
+    if op in ("mean", "average"):
+        return math.fsum(values) / len(values)
+    if op == "median":
+        return get_median(sorted(values))
+    if len(values) < 2:
+        return None
+    mean = math.fsum(values) / len(values)
+    variance = math.fsum((v - mean) ** 2 for v in values) / (len(values) - 1)
+    if op == "variance":
+        return variance
+    return math.sqrt(variance)
+
+
+def get_bin_step(minimum, maximum, maxbins=DEFAULT_MAXBINS):
+    """Return a nice bin step for the extent of the values, in the same
+    way as Vega: a power of ten, possibly divided by 5 or 2.
+    """
+    span = (maximum - minimum) or abs(minimum) or 1
+    level = math.ceil(math.log10(maxbins))
+    step = 10 ** (round(math.log10(span)) - level)
+    while math.ceil(span / step) > maxbins:
+        step *= 10
+    for divisor in (5, 2):
+        if span / (step / divisor) <= maxbins:
+            step /= divisor
+    return step
+
+
+def bin_values(values, maxbins=DEFAULT_MAXBINS):
+    """Return the lists of the start and end of the bin for each value.
+    Null values are in no bin.
+    """
+    non_null = [v for v in values if v is not None]
+    if not non_null:
+        return [None] * len(values), [None] * len(values)
+    minimum = min(non_null)
+    maximum = max(non_null)
+    step = get_bin_step(minimum, maximum, maxbins)
+    first = math.floor(minimum / step) * step
+    # The maximum value is in the last bin, even if it is on its boundary.
+    last = max(0, math.ceil((maximum - first) / step) - 1)
+    start = []
+    end = []
+    for value in values:
+        if value is None:
+            start.append(None)
+            end.append(None)
+        else:
+            pos = min(math.floor((value - first) / step), last)
+            start.append(round_bin(first + pos * step, step))
+            end.append(round_bin(first + (pos + 1) * step, step))
+    return start, end
+
+
+def round_bin(value, step):
+    "Round away the floating point error of a bin boundary."
+    digits = max(0, -math.floor(math.log10(step))) + 1
+    return round(value, digits)
+
+
+def parse_args(args):
+    """Return the query spec from the request arguments:
+    'fields': comma-separated list of fields.
+    'filter': 'field:operator:value', may be repeated.
+    'bin': 'field' or 'field:maxbins', may be repeated.
+    'groupby': comma-separated list of fields.
+    'aggregate': 'op', 'op:field' or 'op:field:name', may be repeated.
+    """
+    spec = {}
+    if args.get("fields"):
+        spec["fields"] = args["fields"].split(",")
+    spec["filter"] = [item.split(":", 2) for item in args.getlist("filter")]
+    spec["bin"] = []
+    for item in args.getlist("bin"):
+        parts = item.split(":", 1)
+        spec["bin"].append({"field": parts[0], "maxbins": parts[1:] and parts[1]})
+    if args.get("groupby"):
+        spec["groupby"] = args["groupby"].split(",")
+    spec["aggregate"] = []
+    for item in args.getlist("aggregate"):
+        parts = item.split(":", 2) + [None, None]
+        spec["aggregate"].append({"op": parts[0], "field": parts[1], "as": parts[2]})
+    return spec
@@ -0,0 +1,162 @@
+"Server-side rendering of Vega-Lite graphics to SVG or PNG, with disk cache."
+
+import os
+import os.path
+import queue
+import tempfile
+import threading
+
+import flask
+
+# The package 'vl-convert-python' is in 'requirements.txt'. If it is not
+# installed, the graphics are rendered only in the browser.
+try:
+    import vl_convert
+except ImportError:
+    vl_convert = None
+
+from datagraphics import constants
+
+RENDER_MIMETYPES = {"svg": constants.SVG_MIMETYPE, "png": constants.PNG_MIMETYPE}
+
+
+def is_available():
+    "Is server-side rendering available?"
+    return vl_convert is not None
+
+
+def thumbnails_available():
+    """Are thumbnails available? They are rendered in the background
+    into the disk cache, so that must be configured.
+    """
+    return is_available() and get_file_cache() is not None
+
+
+def render(specification, format, scale=1):
+    """Render the Vega-Lite specification, which must have its data inlined,
+    in the given format. Return the content as bytes.
+    Raise ValueError if the specification could not be rendered.
+    """
+    if vl_convert is None:
+        raise ValueError("Server-side rendering is not available.")
+    try:
+        if format == "svg":
+            return vl_convert.vegalite_to_svg(specification).encode("utf-8")
+        elif format == "png":
+            return vl_convert.vegalite_to_png(specification, scale=scale)
+    except Exception as error:
+        raise ValueError(f"Could not render graphic: {error}")
+    raise ValueError(f"Invalid render format '{format}'.")
+
+
+class FileCache:
+    """Cache of byte strings stored as files in a directory, bounded by
+    total size. The least recently used files are removed when the size
+    is exceeded; the modification time records the last use.
+    """
+
+    def __init__(self, dirpath, max_size):
+        self.dirpath = dirpath
+        self.max_size = max_size
+        os.makedirs(dirpath, exist_ok=True)
+        self.size = sum([size for filepath, size, mtime in self.files()])
+
+    def files(self):
+        "Return a list of tuples (filepath, size, mtime) for the cached files."
+        result = []
+        for entry in os.scandir(self.dirpath):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                result.append((entry.path, stat.st_size, stat.st_mtime))
+        return result
+
+    def get(self, key):
+        "Return the content for the key, if any. Mark it as recently used."
+        filepath = os.path.join(self.dirpath, key)
+        try:
+            with open(filepath, "rb") as infile:
+                content = infile.read()
+            os.utime(filepath)
+        except OSError:
+            return None
+        return content
+
+    def set(self, key, content):
+        """Store the content for the key, atomically, and remove
+        the least recently used files if the size limit is exceeded.
+        """
+        if len(content) > self.max_size:
+            return
+        fd, tmppath = tempfile.mkstemp(dir=self.dirpath, prefix=".")
+        with os.fdopen(fd, "wb") as outfile:
+            outfile.write(content)
+        os.replace(tmppath, os.path.join(self.dirpath, key))
+        self.size += len(content)
+        if self.size > self.max_size:
+            self.prune()
+
+    def prune(self):
+        "Remove the least recently used files until within the size limit."
+        files = sorted(self.files(), key=lambda f: f[2])
+        self.size = sum([size for filepath, size, mtime in files])
+        for filepath, size, mtime in files:
+            if self.size <= self.max_size:
+                break
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+            self.size -= size
+
+
+# Global cache of rendered graphics.
+_file_cache = None
+
+
+def get_file_cache():
+    "Return the disk cache of rendered graphics, or None if not configured."
+    global _file_cache
+    if _file_cache is None:
+        dirpath = flask.current_app.config["RENDER_CACHE_DIRPATH"]
+        if not dirpath:
+            return None
+        _file_cache = FileCache(dirpath, flask.current_app.config["RENDER_CACHE_SIZE"])
+    return _file_cache
+
+
+# Global queue of background rendering tasks, and the keys of those pending.
+_queue = None
+_queue_pid = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def submit(key, task):
+    """Queue the task for execution in the background rendering thread,
+    unless a task with the same key is already pending. The thread is
+    started in each process, since a forking server may not carry it over.
+    """
+    global _queue, _queue_pid
+    with _pending_lock:
+        if _queue is None or _queue_pid != os.getpid():
+            _queue = queue.Queue()
+            _queue_pid = os.getpid()
+            _pending.clear()
+            threading.Thread(target=execute_tasks, args=(_queue,), daemon=True).start()
+        if key in _pending:
+            return
+        _pending.add(key)
+        _queue.put((key, task))
+
+
+def execute_tasks(tasks):
+    "Execute the tasks from the queue, one at a time, forever."
+    while True:
+        key, task = tasks.get()
+        try:
+            task()
+        except Exception:
+            pass  # The task must report its own errors; the thread goes on.
+        finally:
+            with _pending_lock:
+                _pending.discard(key)
@@ -3,7 +3,9 @@
 import base64
 import copy
 import hashlib
+import json
 
+import couchdb2
 import flask
 
 from datagraphics import constants
@@ -34,12 +36,15 @@ class BaseSaver:
     def __exit__(self, etyp, einst, etb):
         if etyp is not None:
             return False
-        self.finish()
-        self.doc["doctype"] = self.DOCTYPE
-        self.doc["modified"] = utils.get_time()
-        flask.g.db.put(self.doc)
+        self.stage()
+        try:
+            self.store(self.get_log_entry())
+        except couchdb2.RevisionError:
+            # The cached document is stale; the next request must refetch it.
+            utils.uncache_document(self.doc["_id"])
+            raise
         self.wrapup()
-        self.add_log()
+        utils.uncache_document(self.doc["_id"])
 
     def __getitem__(self, key):
         return self.doc[key]
@@ -59,15 +64,35 @@ class BaseSaver:
         "Final changes and checks on the document before storing it."
         pass
 
+    def stage(self):
+        "Make the document ready to be stored."
+        self.finish()
+        self.doc["doctype"] = self.DOCTYPE
+        self.doc["modified"] = utils.get_time()
+
+    def store(self, entry):
+        """Store the document and its log entry.
+        Raise couchdb2.RevisionError if the document could not be stored.
+        """
+        if utils.is_log_write_behind():
+            flask.g.db.put(self.doc)
+            utils.add_log_entry(entry)
+        else:
+            store_with_log(self.doc, entry)
+
+    def is_multipart(self):
+        "Must the document be stored by itself in a multipart request?"
+        return False
+
     def wrapup(self):
         """Wrap up the save operation by performing actions that
         must be done after the document has been stored.
         """
         pass
 
-    def add_log(self):
-        """Add a log entry recording the the difference betweens the current and
-        the original document, hiding values of specified keys.
+    def get_log_entry(self):
+        """Return a log entry recording the the difference betweens the current
+        and the original document, hiding values of specified keys.
         'added': list of keys for items added in the current.
         'updated': dictionary of items updated; original values.
         'removed': dictionary of items removed; original values.
@@ -86,13 +111,16 @@ class BaseSaver:
                 for k in set(self.original or {}).difference(self.doc)
             ]
         )
-        for key in ["_id", "_rev", "modified"]:
+        for key in ["_id", "_rev", "modified", "_attachments"]:
             try:
                 added.remove(key)
             except ValueError:
                 pass
         updated.pop("_rev", None)
         updated.pop("modified", None)
+        # Changes to attachments are recorded by 'add_log_items'.
+        updated.pop("_attachments", None)
+        removed.pop("_attachments", None)
         for key in self.HIDDEN_FIELDS:
             if key in updated:
                 updated[key] = "***"
@@ -118,35 +146,162 @@ class BaseSaver:
         else:
             entry["remote_addr"] = None
             entry["user_agent"] = None
-        flask.g.db.put(entry)
+        return entry
 
     def add_log_items(self):
         "Return a dictionary of additional items to add to the log entry."
         return {}
 
 
+def store_with_log(doc, entry):
+    """Store the document and its log entry in one '_bulk_docs' request.
+    Raise couchdb2.RevisionError if the document could not be stored;
+    the log entry is then deleted.
+    """
+    result, log = flask.g.db.update([doc, entry])
+    if not result[0]:
+        if log[0]:
+            flask.g.db.update([{"_id": log[1], "_rev": log[2], "_deleted": True}])
+        raise couchdb2.RevisionError(result[3])
+    doc["_rev"] = result[2]
+
+
+def save_bulk(savers, deleted=None):
+    """Store the documents of the staged savers and their log entries,
+    and delete the given documents, in one '_bulk_docs' request.
+    The log entries of the deleted documents, and of the documents that
+    could not be stored, are deleted in a second request. The documents
+    with attachments following them are stored each in a separate request,
+    since '_bulk_docs' cannot carry such attachments. Return a dictionary
+    of the error reason by document IUID for those that failed.
+    """
+    errors = {}
+    bulk = []
+    for saver in savers:
+        if not saver.is_multipart():
+            bulk.append(saver)
+            continue
+        try:
+            saver.store(saver.get_log_entry())
+        except couchdb2.RevisionError as error:
+            errors[saver.doc["_id"]] = str(error)
+        else:
+            saver.wrapup()
+        utils.uncache_document(saver.doc["_id"])
+    savers = bulk
+    docs = []
+    for saver in savers:
+        docs.append(saver.doc)
+        docs.append(saver.get_log_entry())
+    for doc in deleted or []:
+        docs.append({"_id": doc["_id"], "_rev": doc["_rev"], "_deleted": True})
+    results = flask.g.db.update(docs)
+    remove = []
+    for pos, saver in enumerate(savers):
+        result = results[2 * pos]
+        log = results[2 * pos + 1]
+        if result[0]:
+            saver.doc["_rev"] = result[2]
+            saver.wrapup()
+        else:
+            errors[saver.doc["_id"]] = result[3]
+            if log[0]:
+                remove.append({"_id": log[1], "_rev": log[2], "_deleted": True})
+        utils.uncache_document(saver.doc["_id"])
+    removed = []
+    for result in results[2 * len(savers) :]:
+        if result[0]:
+            removed.append(result[1])
+        else:
+            errors[result[1]] = result[3]
+        utils.uncache_document(result[1])
+    if removed:
+        for row in flask.g.db.view("logs", "docid", keys=removed):
+            remove.append({"_id": row.id, "_rev": row.value, "_deleted": True})
+    if remove:
+        flask.g.db.update(remove)
+    return errors
+
+
 class AttachmentsSaver(BaseSaver):
     "Document saver context handling attachments."
 
     def prepare(self):
         self._delete_attachments = set()
         self._add_attachments = []
+        self._put_attachments = {}
+
+    def stage(self):
+        """Make the document ready to be stored, including its attachments,
+        so that it is stored with one revision. The added attachments up to
+        ATTACHMENT_INLINE_SIZE bytes are inlined in the document. Larger ones
+        follow it in a multipart request, since inlining as base64 would need
+        several times their size in memory. The deleted ones are removed.
+        """
+        super().stage()
+        inline_size = flask.current_app.config["ATTACHMENT_INLINE_SIZE"]
+        attachments = self.doc.get("_attachments") or {}
+        for filename in self._delete_attachments:
+            attachments.pop(filename, None)
+        self._put_attachments = {}
+        for attachment in self._add_attachments:
+            content = get_bytes(attachment["content"])
+            if len(content) > inline_size:
+                self._put_attachments[attachment["filename"]] = content
+                attachments[attachment["filename"]] = {
+                    "content_type": attachment["mimetype"],
+                    "follows": True,
+                    "length": len(content),
+                }
+            else:
+                attachments[attachment["filename"]] = {
+                    "content_type": attachment["mimetype"],
+                    "data": base64.b64encode(content).decode(),
+                }
+        if attachments:
+            self.doc["_attachments"] = attachments
+        else:
+            self.doc.pop("_attachments", None)
+
+    def store(self, entry):
+        """Store the document and its log entry. If there are attachments
+        to follow the document, it is stored in a multipart request, and
+        the log entry separately afterwards.
+        Raise couchdb2.RevisionError if the document could not be stored.
+        """
+        if not self.is_multipart():
+            super().store(entry)
+            return
+        body = MultipartBody(self.doc, self._put_attachments)
+        db = flask.g.db
+        response = db.server._PUT(
+            db.name,
+            self.doc["_id"],
+            data=body,
+            headers={"Content-Type": body.content_type},
+        )
+        self.doc["_rev"] = response.json()["rev"]
+        if utils.is_log_write_behind():
+            utils.add_log_entry(entry)
+        else:
+            db.put(entry)
+
+    def is_multipart(self):
+        "Must the document be stored by itself in a multipart request?"
+        return bool(self._put_attachments)
 
     def wrapup(self):
-        """Delete any specified attachments.
-        Store the input files as attachments.
-        Must be done after document is saved.
+        """Replace the attachments in the stored document by stubs,
+        as if the document had been fetched from the database.
         """
-        for filename in self._delete_attachments:
-            rev = flask.g.db.delete_attachment(self.doc, filename)
-            self.doc["_rev"] = rev
         for attachment in self._add_attachments:
-            flask.g.db.put_attachment(
-                self.doc,
-                attachment["content"],
-                filename=attachment["filename"],
-                content_type=attachment["mimetype"],
-            )
+            content = get_bytes(attachment["content"])
+            self.doc.setdefault("_attachments", {})[attachment["filename"]] = {
+                "content_type": attachment["mimetype"],
+                "digest": f"md5-{get_digest(content)}",
+                "length": len(content),
+                "stub": True,
+            }
 
     def add_attachment(self, filename, content, mimetype):
         self._add_attachments.append(
@@ -160,19 +315,69 @@ class AttachmentsSaver(BaseSaver):
         "Return a dictionary of additional items to add to the log entry."
         result = {}
         if self._delete_attachments:
-            result["attachments_deleted"] = self._delete_attachments
+            result["attachments_deleted"] = sorted(self._delete_attachments)
         if self._add_attachments:
+            result["attachments_added"] = []
             for att in self._add_attachments:
-                content = att.pop("content")
-                att["length"] = len(content)
-                if isinstance(content, str):
-                    content = content.encode("utf-8")
-                md5 = hashlib.md5(content)
-                att["digest"] = base64.b64encode(md5.digest()).decode("utf-8")
-            result["attachments_added"] = self._add_attachments
+                content = att["content"]
+                item = {
+                    "filename": att["filename"],
+                    "mimetype": att["mimetype"],
+                    "length": len(content),
+                }
+                item["digest"] = get_digest(get_bytes(content))
+                result["attachments_added"].append(item)
         return result
 
 
+class MultipartBody:
+    """The 'multipart/related' body of a request storing the document
+    with the content of its attachments that have the 'follows' flag.
+    The parts are produced as the body is sent, without joining them.
+    Its length is known, so that the request need not be chunked.
+    """
+
+    def __init__(self, doc, contents):
+        boundary = utils.get_iuid()
+        self.content_type = f'multipart/related; boundary="{boundary}"'
+        delimiter = f"--{boundary}\r\n".encode("ascii")
+        self.parts = [
+            delimiter,
+            b"Content-Type: application/json\r\n\r\n",
+            json.dumps(doc).encode("utf-8"),
+            b"\r\n",
+        ]
+        # The order of the parts must be that of the attachments in the doc.
+        for filename, attachment in doc["_attachments"].items():
+            if not attachment.get("follows"):
+                continue
+            self.parts.append(delimiter)
+            self.parts.append(
+                f"Content-Type: {attachment['content_type']}\r\n\r\n".encode("ascii")
+            )
+            self.parts.append(contents[filename])
+            self.parts.append(b"\r\n")
+        self.parts.append(f"--{boundary}--".encode("ascii"))
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def __len__(self):
+        return sum([len(part) for part in self.parts])
+
+
+def get_bytes(content):
+    "Return the content of an attachment as bytes."
+    if isinstance(content, str):
+        return content.encode("utf-8")
+    return content
+
+
+def get_digest(content):
+    "Return the base64-encoded MD5 digest of the bytes content."
+    return base64.b64encode(hashlib.md5(content).digest()).decode("utf-8")
+
+
 class EntitySaver(AttachmentsSaver):
     "Entity saver context handling one file (attachment) per entity."
 
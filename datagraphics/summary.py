@@ -0,0 +1,221 @@
+"Summary statistics for the fields of a dataset."
+
+import base64
+import itertools
+import math
+import operator
+import random
+import zlib
+
+# Number of bits of the hash used to select a HyperLogLog register.
+HLL_PRECISION = 12
+
+# Number of values kept in the sample used for approximate medians.
+SAMPLE_SIZE = 10000
+
+
+class HyperLogLog:
+    "Approximate count of distinct values."
+
+    def __init__(self, registers=None):
+        if registers is None:
+            self.registers = bytearray(1 << HLL_PRECISION)
+        else:
+            self.registers = bytearray(registers)
+
+    def update(self, values):
+        """Add the values to the sketch. The 32-bit hash is CRC32 of the
+        string representation of the value, followed by a mixing step.
+        """
+        registers = self.registers
+        shift = 32 - HLL_PRECISION
+        mask = (1 << shift) - 1
+        for h in map(zlib.crc32, map(str.encode, map(str, values))):
+            h = (h * 0x9E3779B1) & 0xFFFFFFFF
+            h ^= h >> 16
+            pos = h >> shift
+            rank = shift - (h & mask).bit_length() + 1
+            if rank > registers[pos]:
+                registers[pos] = rank
+
+    def merge(self, other):
+        "Merge the other sketch into this one."
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def __len__(self):
+        "Return the estimated number of distinct values."
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / math.fsum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+
+class Summary:
+    """Summary statistics for the values of a field.
+    Count, min, max, mean and the sum of squared deviations are exact.
+    In approximate mode, the number of distinct values is estimated
+    by HyperLogLog and the median from a random sample.
+    In mergeable mode, the sketch and the sample are computed also when
+    the statistics are exact, so that the state can be merged later.
+    """
+
+    def __init__(self, type, approximate=False, mergeable=False):
+        self.type = type
+        self.approximate = approximate
+        self.mergeable = approximate or mergeable
+        self.n = 0
+        self.n_null = 0
+        self.min = None
+        self.max = None
+        self.mean = None
+        self.m2 = None
+        self.median = None
+        self.n_distinct = None
+        self.hll = None
+        self.sample = None
+
+    @classmethod
+    def from_column(cls, column, approximate=False, mergeable=False):
+        "Compute the summary for the values in the column store 'Column'."
+        summary = cls(column.type, approximate=approximate, mergeable=mergeable)
+        summary.n_null = column.n_null
+        summary.update(column.non_null())
+        return summary
+
+    def update(self, values):
+        """Compute the statistics for the given sequence of non-null values.
+        This summary must not contain any values already.
+        The loops are done by built-in functions over the sequence.
+        """
+        self.n = len(values)
+        if self.type == "boolean" or not self.n:
+            return
+        self.min = min(values)
+        self.max = max(values)
+        if self.type in ("integer", "number"):
+            self.mean = math.fsum(values) / self.n
+            self.m2 = math.fsum(
+                map(
+                    pow,
+                    map(operator.sub, values, itertools.repeat(self.mean)),
+                    itertools.repeat(2),
+                )
+            )
+        if self.mergeable:
+            if self.type in ("integer", "string"):
+                self.hll = HyperLogLog()
+                self.hll.update(values)
+            if self.type in ("integer", "number"):
+                if self.n > SAMPLE_SIZE:
+                    self.sample = random.Random(self.n).sample(values, SAMPLE_SIZE)
+                else:
+                    self.sample = list(values)
+        if not self.approximate:
+            if self.type in ("integer", "string"):
+                self.n_distinct = len(set(values))
+            if self.type in ("integer", "number"):
+                self.median = get_median(sorted(values))
+
+    def merge(self, other):
+        """Merge the approximate summary of other values into this one.
+        Count, min, max, mean and the sum of squared deviations stay exact.
+        """
+        if not other.n:
+            self.n_null += other.n_null
+            return
+        if not self.n:
+            n_null = self.n_null + other.n_null
+            self.__dict__.update(other.__dict__)
+            self.n_null = n_null
+            return
+        n = self.n + other.n
+        if self.type != "boolean":
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        if self.type in ("integer", "number"):
+            delta = other.mean - self.mean
+            self.m2 += other.m2 + delta * delta * self.n * other.n / n
+            self.mean += delta * other.n / n
+            self.sample = merge_samples(self.sample, self.n, other.sample, other.n)
+        if self.hll is not None and other.hll is not None:
+            self.hll.merge(other.hll)
+        self.n = n
+        self.n_null += other.n_null
+
+    def get_state(self):
+        "Return the state of the approximate summary as a JSON-able dictionary."
+        return {
+            "type": self.type,
+            "n": self.n,
+            "n_null": self.n_null,
+            "min": self.min,
+            "max": self.max,
+            "mean": self.mean,
+            "m2": self.m2,
+            "hll": self.hll and base64.b64encode(self.hll.registers).decode(),
+            "sample": self.sample and list(self.sample),
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        "Return the approximate summary given its state."
+        summary = cls(state["type"], approximate=True)
+        for key in ("n", "n_null", "min", "max", "mean", "m2", "sample"):
+            setattr(summary, key, state[key])
+        if state["hll"]:
+            summary.hll = HyperLogLog(base64.b64decode(state["hll"]))
+        return summary
+
+    def set_meta(self, meta):
+        "Set the statistics in the 'meta' entry for the field."
+        meta["n_null"] = self.n_null
+        if self.approximate:
+            meta["approximate"] = True
+            if self.hll is not None:
+                self.n_distinct = len(self.hll)
+            if self.sample:
+                self.median = get_median(sorted(self.sample))
+        else:
+            meta.pop("approximate", None)
+        if self.type in ("string", "integer"):
+            meta["n_distinct"] = self.n_distinct or 0
+            meta["min"] = self.min
+            meta["max"] = self.max
+        if self.type in ("integer", "number"):
+            meta["min"] = self.min
+            meta["max"] = self.max
+            meta["mean"] = self.mean
+            meta["median"] = self.median
+            if self.n > 1:
+                meta["stdev"] = math.sqrt(self.m2 / (self.n - 1))
+            else:
+                meta["stdev"] = None
+
+
+def merge_samples(sample, n, other, n_other):
+    """Return a sample of at most SAMPLE_SIZE values of the union of the
+    two populations, given samples of them and their sizes. The values
+    are taken from each sample in proportion to the size of its population.
+    """
+    sample = sample or []
+    other = other or []
+    if len(sample) + len(other) <= SAMPLE_SIZE:
+        return list(sample) + list(other)
+    rng = random.Random(n + n_other)
+    k = min(len(sample), round(SAMPLE_SIZE * n / (n + n_other)))
+    k_other = min(len(other), SAMPLE_SIZE - k)
+    return rng.sample(list(sample), k) + rng.sample(list(other), k_other)
+
+
+def get_median(values):
+    "Return the median of the sorted sequence of values."
+    n = len(values)
+    if not n:
+        return None
+    middle = n // 2
+    if n % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2
@@ -1,28 +1,30 @@
 "User display, register, login/logout, etc endpoints."
 
+import copy
 import http.client
 import json
 import re
+import time
 
+import couchdb2
 import flask
 import flask_mail
 from werkzeug.security import check_password_hash, generate_password_hash
 
 from datagraphics import constants
 from datagraphics import utils
-from datagraphics.datasets import count_datasets_owner, count_datasets_editor
-from datagraphics.graphics import count_graphics_owner, count_graphics_editor
+from datagraphics.datasets import (
+    count_datasets_owner,
+    count_datasets_owners,
+    count_datasets_editor,
+)
+from datagraphics.graphics import (
+    count_graphics_owner,
+    count_graphics_owners,
+    count_graphics_editor,
+)
 from datagraphics.saver import BaseSaver
 
-
-def init(app):
-    "Initialize; update CouchDB design document."
-    db = utils.get_db(app=app)
-    logger = utils.get_logger(app)
-    if db.put_design("users", DESIGN_DOC):
-        logger.info("Updated users design document.")
-
-
 DESIGN_DOC = {
     "views": {
         "username": {
@@ -273,7 +275,8 @@ def edit(username):
             return flask.redirect(flask.url_for(".display", username=username))
         for log in utils.get_logs(user["_id"], cleanup=False):
             flask.g.db.delete(log)
-        flask.g.db.delete(user)
+        utils.delete_document(user)
+        uncache_user(user)
         utils.flash_message(f"Deleted user {username}.")
         utils.get_logger().info(f"deleted user {username}")
         if flask.g.am_admin:
@@ -413,26 +416,82 @@ class UserSaver(BaseSaver):
         "Set a new API key."
         self.doc["apikey"] = utils.get_iuid()
 
+    def wrapup(self):
+        "Remove the user from the caches; status, role or API key may differ."
+        uncache_user(self.doc)
+
 
 # Utility functions
 
 
+# Process-wide index from username or API key to user document.
+# key: (view name, value), value: (IUID, expiry time, user document)
+_user_index = {}
+
+
 def get_user(username=None, email=None, apikey=None):
     """Return the user for the given username, email or apikey.
     Return None if no such user.
+    The lookup by username or API key uses the index of recently seen users.
     """
     if username:
-        rows = flask.g.db.view("users", "username", key=username, include_docs=True)
+        key = ("username", username)
     elif email:
-        rows = flask.g.db.view("users", "email", key=email.lower(), include_docs=True)
+        key = ("email", email.lower())
     elif apikey:
-        rows = flask.g.db.view("users", "apikey", key=apikey, include_docs=True)
+        key = ("apikey", apikey)
     else:
         return None
-    if len(rows) == 1:
-        return rows[0].doc
+    user = get_indexed_user(key)
+    if user is not None:
+        return user
+    rows = flask.g.db.view("users", key[0], key=key[1], include_docs=True)
+    if len(rows) != 1:
+        return None
+    user = rows[0].doc
+    flask.g.cache[user["_id"]] = user
+    ttl = flask.current_app.config["USER_CACHE_TTL"]
+    if ttl and key[0] != "email":
+        _user_index[key] = (user["_id"], time.monotonic() + ttl, copy.deepcopy(user))
+    return user
+
+
+def get_indexed_user(key):
+    """Return the user for the index key, if recently seen and still valid.
+    If the document cache is enabled, the current document is fetched via it,
+    and must match the key, since it may have been changed. Otherwise the
+    document kept in the index is used, which is at most USER_CACHE_TTL
+    seconds old, unless changed in another process.
+    """
+    try:
+        iuid, expires, doc = _user_index[key]
+    except KeyError:
+        return None
+    if time.monotonic() > expires:
+        _user_index.pop(key, None)
+        return None
+    if utils.get_document_cache() is None:
+        try:
+            user = flask.g.cache[iuid]
+        except KeyError:
+            user = flask.g.cache[iuid] = copy.deepcopy(doc)
     else:
+        try:
+            user = utils.get_document(iuid)
+        except couchdb2.NotFoundError:
+            user = None
+    if user is None or user.get(key[0]) != key[1]:
+        _user_index.pop(key, None)
         return None
+    return user
+
+
+def uncache_user(user):
+    "Remove the user from the index and the document caches."
+    for key, (iuid, expires, doc) in list(_user_index.items()):
+        if iuid == user["_id"]:
+            _user_index.pop(key, None)
+    utils.uncache_document(user["_id"])
 
 
 def get_users(role=None, status=None):
@@ -447,12 +506,16 @@ def get_users(role=None, status=None):
         ]
     if status is not None:
         result = [d for d in result if d["status"] == status]
+    # One grouped query per statistic, instead of one query per user.
+    datasets = count_datasets_owners()
+    graphics = count_graphics_owners()
+    storage = get_storages()
     for user in result:
         user["count"] = {
-            "datasets": count_datasets_owner(user["username"]),
-            "graphics": count_graphics_owner(user["username"]),
+            "datasets": datasets.get(user["username"], 0),
+            "graphics": graphics.get(user["username"], 0),
         }
-        user["storage"] = get_storage(user["username"])
+        user["storage"] = storage.get(user["username"], 0)
     return result
 
 
@@ -542,3 +605,11 @@ def get_storage(username):
         return rows[0].value
     else:
         return 0
+
+
+def get_storages():
+    """Return a dictionary of the sum of attachments file sizes for all users.
+    One grouped view query.
+    """
+    view = flask.g.db.view("datasets", "file_size", group_level=1)
+    return dict((row.key, row.value) for row in view)
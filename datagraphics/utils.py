@@ -1,10 +1,17 @@
 "Various utility functions and classes."
 
+import base64
+import collections
+import copy
 import datetime
 import functools
+import hashlib
 import http.client
 import json
 import logging
+import os
+import os.path
+import threading
 import time
 import unicodedata
 import uuid
@@ -16,6 +23,8 @@ import flask_mail
 import jsonschema
 import marko
 import markupsafe
+import requests
+import requests.adapters
 import werkzeug.routing
 
 from datagraphics import constants
@@ -25,7 +34,6 @@ def init(app):
     """Initialize app.
     - Add URL map converters.
     - Add template filters.
-    - Update CouchDB design document.
     """
     app.url_map.converters["name"] = NameConverter
     app.url_map.converters["iuid"] = IuidConverter
@@ -33,20 +41,51 @@ def init(app):
     app.add_template_filter(markdown2html)
     app.add_template_filter(emojize)
     app.add_template_filter(float_default)
-    db = get_db(app=app)
-    logger = get_logger(app)
-    if db.put_design("logs", DESIGN_DOC):
-        logger.info("Updated logs design document.")
 
 
 DESIGN_DOC = {
     "views": {
         "doc": {
             "map": "function(doc) {if (doc.doctype !== 'log') return; emit([doc.docid, doc.timestamp], null);}"
-        }
+        },
+        "docid": {
+            "map": "function(doc) {if (doc.doctype !== 'log') return; emit(doc.docid, doc._rev);}"
+        },
     },
 }
 
+
+def put_designs(designs, app=None):
+    """Update the design documents given as a dictionary by name.
+    Each stored design document holds the hash of its definition in the
+    item 'hash'. The stored ones are fetched in one request, so only one
+    is needed if none has changed. Only the design documents whose stored
+    hash differs are updated, and their views rebuilt.
+    """
+    db = get_db(app=app)
+    logger = get_logger(app)
+    response = db.server._GET(
+        db.name,
+        "_all_docs",
+        params={
+            "keys": json.dumps([f"_design/{name}" for name in designs]),
+            "include_docs": "true",
+        },
+    )
+    # Missing or deleted design documents have no 'doc' item.
+    stored = dict(
+        [(row["key"], row.get("doc") or {}) for row in response.json()["rows"]]
+    )
+    for name, doc in designs.items():
+        digest = hashlib.md5(json.dumps(doc, sort_keys=True).encode()).hexdigest()
+        if stored.get(f"_design/{name}", {}).get("hash") == digest:
+            continue
+        doc = copy.deepcopy(doc)
+        doc["hash"] = digest
+        if db.put_design(name, doc):
+            logger.info(f"Updated {name} design document.")
+
+
 # Global logger instance.
 _logger = None
 
@@ -82,23 +121,200 @@ def get_logger(app=None):
 def set_db(app=None):
     "Sets the database connection and creates the document cache."
     flask.g.db = get_db(app=app)
+    flask.g.cache = {}
+
+
+# Global process-wide CouchDB server connection, the process id it was
+# created in, database instance, and monotonic time of the latest use.
+_server = None
+_server_pid = None
+_db = None
+_db_checked = None
 
 
 def get_db(app=None):
+    """Return the process-wide database instance, using the pooled server
+    connection. It is checked if not used for COUCHDB_HEALTH_CHECK seconds;
+    if the check fails, the connection is created anew.
+    Raise couchdb2.NotFoundError if the database does not exist.
+    """
+    global _server, _db, _db_checked
     if app is None:
         app = flask.current_app
-    return get_server(app=app)[app.config["COUCHDB_DBNAME"]]
+    server = get_server(app=app)
+    now = time.monotonic()
+    if _db is not None and now - _db_checked > app.config["COUCHDB_HEALTH_CHECK"]:
+        try:
+            if not _db.exists():
+                raise couchdb2.NotFoundError
+        except (couchdb2.CouchDB2Exception, requests.RequestException):
+            get_logger(app).warning("CouchDB health check failed; reconnecting.")
+            _server = None
+            _db = None
+            server = get_server(app=app)
+    if _db is None:
+        _db = couchdb2.Database(server, app.config["COUCHDB_DBNAME"])
+    _db_checked = now
+    return _db
 
 
 def get_server(app=None):
+    """Return the process-wide CouchDB server connection.
+    Its HTTP session keeps up to COUCHDB_POOL_SIZE connections alive.
+    """
+    global _server, _server_pid, _db
     if app is None:
         app = flask.current_app
-    return couchdb2.Server(
-        href=app.config["COUCHDB_URL"],
-        username=app.config["COUCHDB_USERNAME"],
-        password=app.config["COUCHDB_PASSWORD"],
+    # Connections must not be shared with a forked worker process.
+    if _server_pid != os.getpid():
+        _server = None
+        _db = None
+    if _server is None:
+        server = couchdb2.Server(
+            href=app.config["COUCHDB_URL"],
+            username=app.config["COUCHDB_USERNAME"],
+            password=app.config["COUCHDB_PASSWORD"],
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=app.config["COUCHDB_POOL_SIZE"]
+        )
+        server._session.mount("http://", adapter)
+        server._session.mount("https://", adapter)
+        _server = server
+        _server_pid = os.getpid()
+    return _server
+
+
+# Global process-wide document cache.
+_document_cache = None
+
+
+def get_document_cache():
+    "Return the process-wide document cache, or None if disabled."
+    global _document_cache
+    if _document_cache is None:
+        config = flask.current_app.config
+        if not config["DOCUMENT_CACHE_SIZE"]:
+            return None
+        _document_cache = DocumentCache(
+            config["DOCUMENT_CACHE_SIZE"], config["DOCUMENT_CACHE_REFRESH"]
+        )
+    return _document_cache
+
+
+def get_document(iuid):
+    """Return the document given its IUID, from the per-request cache,
+    from the process-wide document cache, or from the database.
+    Raise couchdb2.NotFoundError if no such document.
+    """
+    try:
+        return flask.g.cache[iuid]
+    except KeyError:
+        pass
+    cache = get_document_cache()
+    if cache is None:
+        doc = flask.g.db[iuid]
+    else:
+        doc = cache.get_document(iuid)
+    flask.g.cache[iuid] = doc
+    return doc
+
+
+def fetch_documents(iuids):
+    """Fetch the documents given by their IUIDs into the per-request cache,
+    in one request for those not already there. Missing ones are skipped.
+    """
+    missing = [iuid for iuid in iuids if iuid and iuid not in flask.g.cache]
+    if missing:
+        for doc in flask.g.db.get_bulk(missing):
+            if doc is not None and not doc.get("_deleted"):
+                flask.g.cache[doc["_id"]] = doc
+
+
+def delete_document(doc):
+    "Delete the document from the database, and remove it from the caches."
+    flask.g.db.delete(doc)
+    uncache_document(doc["_id"])
+
+
+def uncache_document(iuid):
+    "Remove the document from the caches, since it has been changed."
+    if hasattr(flask.g, "cache"):
+        flask.g.cache.pop(iuid, None)
+    cache = get_document_cache()
+    if cache is not None:
+        cache.pop(iuid)
+
+
+def get_attachment_response(doc, filename, mimetype):
+    """Return a response streaming the attachment of the document directly
+    from CouchDB in chunks of DOWNLOAD_CHUNK_SIZE bytes. A HTTP Range
+    request header is passed on, and the partial content returned.
+    """
+    server = flask.g.db.server
+    # Identity encoding; otherwise the Content-Length would not match.
+    headers = {"Accept-Encoding": "identity"}
+    if "Range" in flask.request.headers:
+        headers["Range"] = flask.request.headers["Range"]
+    upstream = server._session.get(
+        server._href([flask.g.db.name, doc["_id"], filename]),
+        params={"rev": doc["_rev"]},
+        headers=headers,
+        stream=True,
+    )
+    try:
+        server._check(upstream, errors={206: None, 416: None})
+    except Exception:
+        upstream.close()
+        raise
+    response = flask.Response(
+        upstream.raw.stream(
+            flask.current_app.config["DOWNLOAD_CHUNK_SIZE"], decode_content=False
+        ),
+        status=upstream.status_code,
+        mimetype=mimetype,
     )
-    
+    for key in ("Content-Length", "Content-Range"):
+        if key in upstream.headers:
+            response.headers.set(key, upstream.headers[key])
+    response.headers.set("Accept-Ranges", "bytes")
+    response.call_on_close(upstream.close)
+    return response
+
+
+def get_not_modified_response(etag, modified=None, weak=False):
+    """Return a '304 Not Modified' response if the conditional headers
+    of the request show that the client has the current representation
+    given by the ETag and/or the modified timestamp. Otherwise None.
+    """
+    request = flask.request
+    if request.method not in ("GET", "HEAD"):
+        return None
+    if request.if_none_match:
+        if not request.if_none_match.contains_weak(etag):
+            return None
+    elif modified and request.if_modified_since:
+        if to_datetime(modified) > request.if_modified_since:
+            return None
+    else:
+        return None
+    response = flask.Response(status=http.client.NOT_MODIFIED)
+    set_validators(response, etag, modified=modified, weak=weak)
+    return response
+
+
+def set_validators(response, etag, modified=None, weak=False):
+    "Set the ETag, and the Last-Modified header if timestamp given."
+    response.set_etag(etag, weak=weak)
+    if modified:
+        response.last_modified = to_datetime(modified)
+
+
+def to_datetime(timestamp):
+    "Convert the ISO timestamp to a UTC datetime, truncated to seconds."
+    instant = datetime.datetime.fromisoformat(timestamp[:19])
+    return instant.replace(tzinfo=datetime.timezone.utc)
+
 
 def get_count(designname, viewname, key=None):
     "Get the count for the given view and key."
@@ -112,6 +328,132 @@ def get_count(designname, viewname, key=None):
         return 0
 
 
+class Page(list):
+    "A page of items from a view, with the cursor for the next page, if any."
+
+    def __init__(self, items=(), next=None):
+        super().__init__(items)
+        self.next = next
+
+
+def get_view_page(
+    designname, viewname, startkey, endkey, cursor=None, limit=None, include_docs=False
+):
+    """Return a Page of the rows from the view, in descending key order.
+    The cursor gives the key and document IUID of the first row of the page,
+    used as 'startkey' and 'startkey_docid' in the view query.
+    Raise ValueError if the cursor is invalid.
+    """
+    params = {"descending": "true", "reduce": "false"}
+    if cursor:
+        startkey, params["startkey_docid"] = decode_cursor(cursor, startkey, endkey)
+    params["startkey"] = json.dumps(startkey)
+    params["endkey"] = json.dumps(endkey)
+    if limit:
+        # One more row than the page size, to get the cursor for the next page.
+        params["limit"] = str(limit + 1)
+    if include_docs:
+        params["include_docs"] = "true"
+    # The couchdb2 'view' method does not handle 'startkey_docid'.
+    db = flask.g.db
+    response = db.server._GET(
+        db.name, "_design", designname, "_view", viewname, params=params
+    )
+    rows = [
+        couchdb2.Row(r.get("id"), r.get("key"), r.get("value"), r.get("doc"))
+        for r in response.json().get("rows", [])
+    ]
+    if limit and len(rows) > limit:
+        return Page(rows[:limit], encode_cursor(rows[limit].key, rows[limit].id))
+    return Page(rows)
+
+
+def get_view_rows(designname, viewname, keys, **params):
+    """Return the rows from the view for the given keys, in one request.
+    The keys are sent in the body of a POST, so their number is not limited
+    by the length of the URL. The query parameters are JSON-encoded.
+    """
+    if not keys:
+        return []
+    db = flask.g.db
+    response = db.server._POST(
+        db.name,
+        "_design",
+        designname,
+        "_view",
+        viewname,
+        json={"keys": keys},
+        params=dict([(key, json.dumps(value)) for key, value in params.items()]),
+    )
+    return [
+        couchdb2.Row(r.get("id"), r.get("key"), r.get("value"), r.get("doc"))
+        for r in response.json().get("rows", [])
+    ]
+
+
+def encode_cursor(key, iuid):
+    "Return the cursor for the view row given by its key and document IUID."
+    data = json.dumps([key, iuid], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii")
+
+
+def decode_cursor(cursor, startkey, endkey):
+    """Return the key and document IUID given by the cursor.
+    Raise ValueError if invalid, or if outside the range of the view query;
+    parts that are the same in the start and end keys must match.
+    """
+    try:
+        key, iuid = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if not isinstance(iuid, str):
+        raise ValueError("invalid cursor")
+    if isinstance(startkey, (list, tuple)):
+        if not isinstance(key, list) or len(key) != len(startkey):
+            raise ValueError("invalid cursor")
+        for part, start, end in zip(key, startkey, endkey):
+            if not isinstance(part, str) or (start == end and part != start):
+                raise ValueError("invalid cursor")
+    elif not isinstance(key, str):
+        raise ValueError("invalid cursor")
+    return key, iuid
+
+
+def get_paging(paged=False):
+    """Return the cursor and the page size from the request arguments
+    'cursor' and 'limit'. If neither is given, the page size is None,
+    meaning that the whole list is returned, unless 'paged' is True.
+    Raise ValueError if invalid.
+    """
+    config = flask.current_app.config
+    cursor = flask.request.args.get("cursor") or None
+    limit = flask.request.args.get("limit")
+    if limit is None:
+        if cursor is None and not paged:
+            return None, None
+        limit = config["LIST_PAGE_SIZE"]
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("invalid limit")
+        if limit <= 0:
+            raise ValueError("invalid limit")
+        limit = min(limit, config["LIST_MAX_PAGE_SIZE"])
+    return cursor, limit
+
+
+def get_next_url(page, _external=False):
+    "Return the URL for the next page of the current request, or None."
+    if page.next is None:
+        return None
+    args = dict(flask.request.view_args)
+    if "limit" in flask.request.args:
+        args["limit"] = flask.request.args["limit"]
+    args["cursor"] = page.next
+    return flask.url_for(flask.request.endpoint, _external=_external, **args)
+
+
 def get_logs(docid, cleanup=True):
     """Return the list of log entries for the given document identifier,
     sorted by reverse timestamp.
@@ -134,6 +476,40 @@ def get_logs(docid, cleanup=True):
     return result
 
 
+def is_log_write_behind():
+    """Are log entries to be written after the response has been sent?
+    Only within a request, and if so configured.
+    """
+    return (
+        flask.has_request_context()
+        and flask.current_app.config["LOG_WRITE_BEHIND"]
+        and hasattr(flask.g, "log_entries")
+    )
+
+
+def add_log_entry(entry):
+    "Add the log entry to the buffer of the current request."
+    flask.g.log_entries.append(entry)
+
+
+def flush_log_entries(response):
+    """Write the buffered log entries in one '_bulk_docs' request
+    when the response has been sent.
+    """
+    entries = flask.g.pop("log_entries", None)
+    if entries:
+        db = flask.g.db
+        response.call_on_close(lambda: db.update(entries))
+    return response
+
+
+def flush_log_entries_remaining(exception=None):
+    "Write any log entries remaining in the buffer; the response failed."
+    entries = flask.g.pop("log_entries", None)
+    if entries:
+        flask.g.db.update(entries)
+
+
 def log_access(response):
     "Record access using the logger."
     if flask.g.current_user:
@@ -151,6 +527,7 @@ def log_access(response):
 # Global instance of mail interface.
 mail = flask_mail.Mail()
 
+
 # Decorators for endpoints
 def login_required(f):
     "Decorator for checking if logged in. Send to login page if not."
@@ -213,6 +590,101 @@ class Timer:
         return round(1000 * self())
 
 
+class LruCache:
+    """Least-recently-used cache of byte strings, bounded by total size.
+    Values larger than the maximum size are not stored. Thread-safe.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.items = collections.OrderedDict()
+        self.lock = threading.RLock()
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        "Return the value for the key, if any. Mark it as recently used."
+        with self.lock:
+            try:
+                self.items.move_to_end(key)
+            except KeyError:
+                return default
+            return self.items[key]
+
+    def set(self, key, value):
+        "Store the value for the key, evicting the least recently used."
+        with self.lock:
+            self.pop(key)
+            if len(value) > self.max_size:
+                return
+            self.items[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                self.size -= len(self.items.popitem(last=False)[1])
+
+    def pop(self, key):
+        "Remove the value for the key, if any."
+        with self.lock:
+            try:
+                self.size -= len(self.items.pop(key))
+            except KeyError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+class DocumentCache(LruCache):
+    """Process-wide LRU cache of documents, bounded by the total size of
+    their JSON representations. A document is removed when changed by
+    a saver in this process. Changes made by other processes are found
+    in the CouchDB changes feed, which is checked at most once per
+    'refresh' seconds.
+    """
+
+    def __init__(self, max_size, refresh):
+        super().__init__(max_size)
+        self.refresh = refresh
+        self.last_seq = None
+        self.last_check = None
+
+    def get_document(self, iuid):
+        "Return the document. Raise couchdb2.NotFoundError if none."
+        self.check_changes()
+        value = self.get(iuid)
+        if value is None:
+            doc = flask.g.db[iuid]
+            self.set(iuid, json.dumps(doc).encode("utf-8"))
+        else:
+            doc = json.loads(value)
+        return doc
+
+    def check_changes(self):
+        "Remove the documents changed in the database since the last check."
+        with self.lock:
+            now = time.monotonic()
+            if self.last_check is not None and now - self.last_check < self.refresh:
+                return
+            self.last_check = now
+            db = flask.g.db
+            if self.last_seq is None:
+                params = {"since": "now"}
+            else:
+                params = {"since": self.last_seq, "limit": 1000}
+            data = db.server._GET(db.name, "_changes", params=params).json()
+            if self.last_seq is not None:
+                if len(data["results"]) >= params["limit"]:
+                    self.clear()
+                else:
+                    for result in data["results"]:
+                        self.pop(result["id"])
+            self.last_seq = data["last_seq"]
+
+
 def get_iuid():
     "Return a new IUID, which is a UUID4 pseudo-random string."
     return uuid.uuid4().hex
@@ -393,15 +865,92 @@ def slugify(s, lowercase=False):
     return "".join([c for c in s if c in constants.SLUG_CHARS])
 
 
+# Global cache of the documentation; file modification time, TOC and HTML.
+_documentation = None
+
+
+def get_documentation():
+    """Return the table of contents and the HTML of the file 'documentation.md'.
+    Read and preprocessed when first used, and when the file has changed.
+    """
+    global _documentation
+    filepath = os.path.join(constants.ROOT, "documentation.md")
+    mtime = os.path.getmtime(filepath)
+    if _documentation is not None and _documentation[0] == mtime:
+        return _documentation[1:]
+    with open(filepath) as infile:
+        lines = infile.readlines()
+    toc = []
+    current_level = 0
+    for line in lines:
+        if line.startswith("#"):
+            parts = line.split()
+            level = len(parts[0])
+            title = " ".join(parts[1:])
+            # All headers in the file are "clean", i.e. text only, no markup.
+            id = title.strip().replace(" ", "-").lower()
+            id = "".join(c for c in id if c in constants.ALLOWED_ID_CHARACTERS)
+            # Add to table of contents.
+            if level <= 2:
+                if level > current_level:
+                    for l in range(current_level, level):
+                        toc.append('<ul class="list-unstyled ml-3">')
+                    current_level = level
+                elif level < current_level:
+                    for l in range(level, current_level):
+                        toc.append("</ul>")
+                    current_level = level
+                toc.append(f'<li><a href="#{id}">{title}</a></li>')
+    for level in range(current_level):
+        toc.append("</ul>")
+    _documentation = (mtime, "\n".join(toc), markdown2html("".join(lines)))
+    return _documentation[1:]
+
+
+# Global cache of the Vega-Lite JSON Schemas, keyed by version.
+_vega_lite_schemas = {}
+
+# Global cache of the compiled Vega-Lite schema validators, keyed by version.
+_vega_lite_validators = {}
+
+
+def get_vega_lite_schema():
+    "Return the JSON Schema for Vega-Lite, read from 'static' when first used."
+    version = constants.VEGA_LITE_VERSION
+    try:
+        return _vega_lite_schemas[version]
+    except KeyError:
+        filepath = os.path.join(constants.ROOT, f"static/v{version}.json")
+        with open(filepath) as infile:
+            _vega_lite_schemas[version] = json.load(infile)
+        return _vega_lite_schemas[version]
+
+
+def get_vega_lite_validator():
+    """Return the validator for the Vega-Lite JSON schema, compiled when
+    first used. The schema itself is checked only when compiled.
+    """
+    version = constants.VEGA_LITE_VERSION
+    try:
+        return _vega_lite_validators[version]
+    except KeyError:
+        schema = get_vega_lite_schema()
+        cls = jsonschema.validators.validator_for(schema)
+        cls.check_schema(schema)
+        validator = cls(schema, format_checker=jsonschema.draft7_format_checker)
+        _vega_lite_validators[version] = validator
+        return validator
+
+
 def validate_vega_lite(spec):
     """Validate the given spec as proper Vega-Lite.
     Raises 'jsonschema.ValidationError' if something is wrong.
     """
-    jsonschema.validate(
-        spec,
-        flask.current_app.config["VEGA_LITE_SCHEMA"],
-        format_checker=jsonschema.draft7_format_checker,
+    error = jsonschema.exceptions.best_match(
+        get_vega_lite_validator().iter_errors(spec)
     )
+    if error is not None:
+        raise error
 
 
 def accept_json():
@@ -411,10 +960,12 @@ def accept_json():
     return best == constants.JSON_MIMETYPE and acc[best] > acc[constants.HTML_MIMETYPE]
 
 
-def jsonify(data, id=None, timestamp=True, schema=None):
+def jsonify(data, id=None, timestamp=True, schema=None, etag=None):
     """Return a Response object containing the JSON of 'data'.
     Fix up the JSON structure for external representation.
     Optionally add a header Link to the schema given by its URL.
+    A weak ETag is set; if not given, it is computed from the content.
+    A conditional GET that matches it gets the response '304 Not Modified'.
     """
     result = {"$id": flask.request.url}
     try:
@@ -430,12 +981,25 @@ def jsonify(data, id=None, timestamp=True, schema=None):
     result.update(data)
     result.pop("_rev", None)
     result.pop("doctype", None)
-    response = flask.jsonify(result)
+    if etag is None:
+        # Weak ETag from the content, excluding the timestamp.
+        etag = get_etag(dict((k, v) for k, v in result.items() if k != "timestamp"))
+    response = get_not_modified_response(etag, weak=True)
+    if response is None:
+        response = flask.jsonify(result)
+        set_validators(response, etag, weak=True)
     if schema:
         response.headers.add("Link", schema, rel="schema")
     return response
 
 
+def get_etag(*parts):
+    "Return an ETag computed from the parts, which must be JSON-serializable."
+    return hashlib.md5(
+        json.dumps(parts, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
 class JsonTraverser:
     "Traverse the JSON data structure, and handle each path/value pair."
 
@@ -84,6 +84,47 @@ def test_user_datasets(settings, headers, schemas):
     check_schema(response, schemas)
 
 
+def test_user_datasets_paging(settings, headers, schemas):
+    "Datasets access by pages."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    created = set()
+    for title in ["first", "second", "third"]:
+        response = requests.post(url, headers=headers, json={"title": title})
+        assert response.status_code == http.client.OK
+        created.add(check_schema(response, schemas)["$id"])
+
+    # Without 'limit' or 'cursor', the whole list is returned.
+    url = f"{settings['BASE_URL']}api/datasets/user/{settings['USER_USERNAME']}"
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    data = check_schema(response, schemas)
+    assert "next" not in data
+    assert created.issubset([d["href"] for d in data["datasets"]])
+
+    # Get the datasets two at a time, following the 'next' links.
+    response = requests.get(url, headers=headers, params={"limit": 2})
+    assert response.status_code == http.client.OK
+    data = check_schema(response, schemas)
+    assert len(data["datasets"]) == 2
+    hrefs = [d["href"] for d in data["datasets"]]
+    while "next" in data:
+        response = requests.get(data["next"]["href"], headers=headers)
+        assert response.status_code == http.client.OK
+        data = check_schema(response, schemas)
+        assert len(data["datasets"]) <= 2
+        hrefs.extend([d["href"] for d in data["datasets"]])
+    assert len(hrefs) == len(set(hrefs))
+    assert created.issubset(hrefs)
+
+    # Invalid cursor.
+    response = requests.get(url, headers=headers, params={"cursor": "junk"})
+    assert response.status_code == http.client.BAD_REQUEST
+
+    for href in created:
+        response = requests.delete(href, headers=headers)
+        assert response.status_code == http.client.NO_CONTENT
+
+
 def test_create_dataset(settings, headers, schemas):
     "Dataset create, update, delete."
     url = f"{settings['BASE_URL']}api/dataset/"
@@ -117,6 +158,68 @@ def test_create_dataset(settings, headers, schemas):
     assert response.status_code == http.client.NO_CONTENT
 
 
+def test_bulk_datasets(settings, headers, schemas):
+    "Create, update and delete datasets in bulk."
+    url = f"{settings['BASE_URL']}api/datasets/_bulk"
+
+    # Create two datasets.
+    response = requests.post(
+        url,
+        headers=headers,
+        json={"datasets": [{"title": "first"}, {"title": "second", "public": True}]},
+    )
+    assert response.status_code == http.client.OK
+    results = check_schema(response, schemas)["datasets"]
+    assert [r["status"] for r in results] == [http.client.CREATED] * 2
+    iuids = [r["iuid"] for r in results]
+
+    # Update one, and one that does not exist.
+    response = requests.post(
+        url,
+        headers=headers,
+        json={
+            "datasets": [
+                {"iuid": iuids[0], "description": "Updated."},
+                {"iuid": "0" * 32, "title": "missing"},
+            ]
+        },
+    )
+    assert response.status_code == http.client.OK
+    results = check_schema(response, schemas)["datasets"]
+    assert results[0]["status"] == http.client.OK
+    assert results[1]["status"] == http.client.NOT_FOUND
+    response = requests.get(results[0]["href"], headers=headers)
+    assert check_schema(response, schemas)["description"] == "Updated."
+
+    # The same dataset may not occur twice.
+    response = requests.post(
+        url,
+        headers=headers,
+        json={
+            "datasets": [
+                {"iuid": iuids[0], "title": "once"},
+                {"iuid": iuids[0], "title": "twice"},
+            ]
+        },
+    )
+    assert response.status_code == http.client.BAD_REQUEST
+
+    # Delete both.
+    response = requests.post(
+        url,
+        headers=headers,
+        json={"datasets": [{"iuid": iuid, "delete": True} for iuid in iuids]},
+    )
+    assert response.status_code == http.client.OK
+    results = check_schema(response, schemas)["datasets"]
+    assert [r["status"] for r in results] == [http.client.NO_CONTENT] * 2
+    for iuid in iuids:
+        response = requests.get(
+            f"{settings['BASE_URL']}api/dataset/{iuid}", headers=headers
+        )
+        assert response.status_code == http.client.NOT_FOUND
+
+
 def test_upload_json_dataset(settings, headers, schemas):
     "Create, upload, update and destroy a dataset using JSON."
     url = f"{settings['BASE_URL']}api/dataset/"
@@ -241,6 +344,228 @@ def test_upload_csv_dataset(settings, headers, schemas):
     assert response.status_code == http.client.NO_CONTENT
 
 
+def test_upload_csv_dataset_encoding(settings, headers, schemas):
+    "Upload CSV data with non-ASCII characters only after a long ASCII start."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    data = [{"col1": pos, "col2": "apa"} for pos in range(10000)]
+    data.append({"col1": len(data), "col2": "blåbär"})
+
+    # Create the dataset.
+    response = requests.post(url, headers=headers, json={"title": "My title"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+
+    # Upload CSV data content encoded as latin-1.
+    outfile = io.StringIO()
+    writer = csv.DictWriter(outfile, ["col1", "col2"])
+    writer.writeheader()
+    for record in data:
+        writer.writerow(record)
+    content = outfile.getvalue().encode("latin-1")
+    assert content.index("å".encode("latin-1")) > 65536
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.csv"
+    response = requests.put(url, headers=headers, data=content)
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Check content.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    assert response.json()[-1] == data[-1]
+
+    # Delete the dataset.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.delete(url, headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
+def test_dataset_content_range(settings, headers, schemas):
+    "Create, upload, get partial content of and destroy a dataset."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    data = [{"col1": 1, "col2": "apa"}, {"col1": 2, "col2": "blarg"}]
+
+    # Create the dataset and upload JSON data content.
+    response = requests.post(url, headers=headers, json={"title": "Range"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.put(url, headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Get the full content.
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    content = response.content
+    assert json.loads(content) == data
+
+    # Get the first ten bytes of the content.
+    response = requests.get(url, headers={"Range": "bytes=0-9", **headers})
+    assert response.status_code == http.client.PARTIAL_CONTENT
+    assert response.headers["Content-Range"] == f"bytes 0-9/{len(content)}"
+    assert response.content == content[:10]
+
+    # Delete the dataset.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.delete(url, headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
+def test_dataset_content_conditional(settings, headers, schemas):
+    "Create, upload, get conditionally and destroy a dataset."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    data = [{"col1": 1, "col2": "apa"}, {"col1": 2, "col2": "blarg"}]
+
+    # Create the dataset and upload JSON data content.
+    response = requests.post(url, headers=headers, json={"title": "Conditional"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.put(url, headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Get the content and its ETag.
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    etag = response.headers["ETag"]
+
+    # The content has not been modified.
+    response = requests.get(url, headers={"If-None-Match": etag, **headers})
+    assert response.status_code == http.client.NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert not response.content
+
+    # After an update, the content is returned with a new ETag.
+    data.append({"col1": 3, "col2": "stuff"})
+    response = requests.put(url, headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+    response = requests.get(url, headers={"If-None-Match": etag, **headers})
+    assert response.status_code == http.client.OK
+    assert response.headers["ETag"] != etag
+    assert response.json() == data
+
+    # Delete the dataset.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.delete(url, headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
+def test_query_dataset(settings, headers, schemas):
+    "Create, upload, query and destroy a dataset."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    data = [
+        {"col1": 1, "col2": "apa"},
+        {"col1": 2, "col2": "blarg"},
+        {"col1": 3, "col2": "apa"},
+        {"col1": 4, "col2": None},
+    ]
+
+    # Create the dataset.
+    response = requests.post(url, headers=headers, json={"title": "My title"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+
+    # Upload JSON data content.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.put(url, headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Projection and filter.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}/query"
+    response = requests.get(
+        url, headers=headers, params={"fields": "col1", "filter": "col1:gt:2"}
+    )
+    assert response.status_code == http.client.OK
+    assert response.json() == [{"col1": 3}, {"col1": 4}]
+
+    # Group by and aggregate.
+    response = requests.get(
+        url,
+        headers=headers,
+        params={"groupby": "col2", "aggregate": ["count", "sum:col1"]},
+    )
+    assert response.status_code == http.client.OK
+    result = dict((r["col2"], r) for r in response.json())
+    assert result["apa"]["count"] == 2
+    assert result["apa"]["sum_col1"] == 4
+    assert result[None]["count"] == 1
+
+    # Aggregate of no records.
+    response = requests.get(
+        url,
+        headers=headers,
+        params={"filter": "col1:gt:10", "aggregate": ["count", "sum:col1"]},
+    )
+    assert response.status_code == http.client.OK
+    assert response.json() == [{"count": 0, "sum_col1": None}]
+
+    # Bad query.
+    response = requests.get(url, headers=headers, params={"fields": "nonexistent"})
+    assert response.status_code == http.client.BAD_REQUEST
+
+    # Numerical aggregate of a string field.
+    response = requests.get(url, headers=headers, params={"aggregate": "mean:col2"})
+    assert response.status_code == http.client.BAD_REQUEST
+
+    # Delete the dataset.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.delete(url, headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
+def test_append_dataset(settings, headers, schemas):
+    "Create, upload, append to and destroy a dataset."
+    url = f"{settings['BASE_URL']}api/dataset/"
+    data = [{"col1": 1, "col2": "apa"}, {"col1": 2, "col2": "blarg"}]
+
+    # Create the dataset.
+    response = requests.post(url, headers=headers, json={"title": "My title"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+
+    # Upload JSON data content.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.put(url, headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Append records as JSON and as CSV.
+    response = requests.post(
+        url,
+        headers=headers,
+        params={"mode": "append"},
+        json=[{"col1": 3, "col2": None}],
+    )
+    assert response.status_code == http.client.NO_CONTENT
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.csv"
+    response = requests.post(
+        url, headers=headers, params={"mode": "append"}, data="col1,col2\n4,apa\n"
+    )
+    assert response.status_code == http.client.NO_CONTENT
+
+    # Bad append; wrong type of value.
+    response = requests.post(
+        url, headers=headers, params={"mode": "append"}, data="col1,col2\nx,apa\n"
+    )
+    assert response.status_code == http.client.BAD_REQUEST
+
+    # Check content and meta.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+    assert dataset["n_records"] == 4
+    assert dataset["meta"]["col1"]["max"] == 4
+    assert dataset["meta"]["col2"]["n_null"] == 1
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}.json"
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    assert [r["col1"] for r in response.json()] == [1, 2, 3, 4]
+
+    # Delete the dataset.
+    url = f"{settings['BASE_URL']}api/dataset/{dataset['iuid']}"
+    response = requests.delete(url, headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
 def test_upload_dataset_update_bad(settings, headers, schemas):
     "Create, upload dataset and attempt bad update."
     url = f"{settings['BASE_URL']}api/dataset/"
@@ -370,6 +695,81 @@ def test_create_graphic(settings, headers, schemas):
     assert response.status_code == http.client.NO_CONTENT
 
 
+def test_bulk_graphics_bad(settings, headers):
+    "Bulk graphics data with an invalid dataset value."
+    url = f"{settings['BASE_URL']}api/graphics/_bulk"
+    for dataset in (["0" * 32], {"iuid": "0" * 32}):
+        response = requests.post(
+            url,
+            headers=headers,
+            json={"graphics": [{"title": "test", "dataset": dataset}]},
+        )
+        assert response.status_code == http.client.BAD_REQUEST
+
+
+def test_render_graphic(settings, headers, schemas):
+    "Get a graphic rendered on the server as SVG and PNG, if available."
+    url = f"{settings['BASE_URL']}api/about/software"
+    response = requests.get(url, headers=headers)
+    assert response.status_code == http.client.OK
+    software = check_schema(response, schemas)["software"]
+    available = "vl-convert" in [s["name"] for s in software]
+
+    # Create the dataset, and upload JSON data content to it.
+    url = f"{settings['BASE_URL']}api/dataset/"
+    response = requests.post(url, headers=headers, json={"title": "test"})
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+    data = [{"col1": 1, "col2": 3.0}, {"col1": 2, "col2": 4.1}]
+    response = requests.put(dataset["$id"] + ".json", headers=headers, json=data)
+    assert response.status_code == http.client.NO_CONTENT
+    response = requests.get(dataset["$id"], headers=headers)
+    assert response.status_code == http.client.OK
+    dataset = check_schema(response, schemas)
+
+    # Create the graphic, and set a correct specification.
+    url = f"{settings['BASE_URL']}api/graphic/"
+    response = requests.post(
+        url, headers=headers, json={"title": "test", "dataset": dataset["iuid"]}
+    )
+    assert response.status_code == http.client.OK
+    graphic = check_schema(response, schemas)
+    response = requests.post(
+        graphic["$id"],
+        headers=headers,
+        json={
+            "specification": {
+                "data": {"url": dataset["content"]["json"]["href"]},
+                "mark": "point",
+                "encoding": {
+                    "x": {"field": "col1", "type": "quantitative"},
+                    "y": {"field": "col2", "type": "quantitative"},
+                },
+            }
+        },
+    )
+    assert response.status_code == http.client.OK
+    graphic = check_schema(response, schemas)
+    assert not bool(graphic["error"])
+
+    # Get the rendered graphic; not found if rendering is not available.
+    for ext, mimetype in [("svg", "image/svg+xml"), ("png", "image/png")]:
+        url = f"{settings['BASE_URL']}graphic/{graphic['iuid']}.{ext}"
+        response = requests.get(url, headers=headers, allow_redirects=False)
+        if available:
+            assert response.status_code == http.client.OK
+            assert response.headers["Content-Type"].startswith(mimetype)
+            assert response.content
+        else:
+            assert response.status_code == http.client.NOT_FOUND
+
+    # Delete the graphic and the dataset.
+    response = requests.delete(graphic["$id"], headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+    response = requests.delete(dataset["$id"], headers=headers)
+    assert response.status_code == http.client.NO_CONTENT
+
+
 def test_links(settings, headers):
     "Check that all links from the root and onwards can be traversed."
     base_url = f"{settings['BASE_URL']}api"
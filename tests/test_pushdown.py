@@ -0,0 +1,135 @@
+"""Test the push down of Vega-Lite aggregates and bins to a dataset query.
+
+Does not need a running server.
+"""
+
+import copy
+
+import flask
+import pytest
+
+import datagraphics.api.dataset
+import datagraphics.config
+import datagraphics.graphic
+import datagraphics.pushdown
+from datagraphics import utils
+
+IUID = "0123456789abcdef0123456789abcdef"
+
+META = {"a": {"type": "integer"}, "b": {"type": "string"}}
+
+SPECIFICATION = {
+    "data": {"url": f"http://localhost/api/dataset/{IUID}.json"},
+    "mark": "bar",
+    "encoding": {
+        "x": {"field": "a", "type": "quantitative", "bin": {"maxbins": 20}},
+        "y": {"aggregate": "count", "type": "quantitative"},
+    },
+}
+
+
+@pytest.fixture
+def app():
+    "Return a minimal app for building the URLs of the dataset resources."
+    app = flask.Flask(__name__)
+    app.config.from_mapping(datagraphics.config.DEFAULT_SETTINGS)
+    app.config["SERVER_NAME"] = "localhost"
+    app.config["VEGA_LITE_PUSHDOWN_RECORDS"] = 100
+    utils.init(app)
+    app.register_blueprint(
+        datagraphics.api.dataset.blueprint, url_prefix="/api/dataset"
+    )
+    with app.test_request_context():
+        yield app
+
+
+def get_specification(channel, **changes):
+    "Return a copy of the specification with the encoding channel changed."
+    result = copy.deepcopy(SPECIFICATION)
+    result["encoding"][channel].update(changes)
+    return result
+
+
+def test_pushdown():
+    "Push down a count of binned values."
+    query, specification = datagraphics.pushdown.get_pushdown(SPECIFICATION, META)
+    assert query == {
+        "groupby": [],
+        "aggregate": [{"op": "count", "field": None, "as": "count"}],
+        "bin": [{"field": "a", "maxbins": 20}],
+    }
+    assert specification["encoding"]["x"]["field"] == "bin_a"
+    assert specification["encoding"]["x2"] == {"field": "bin_a_end"}
+    assert specification["encoding"]["y"]["field"] == "count"
+
+
+@pytest.mark.parametrize(
+    "channel,changes",
+    [
+        ("x", {"bin": {"maxbins": 1}}),
+        ("x", {"bin": {"maxbins": "many"}}),
+        ("x", {"bin": {"maxbins": True}}),
+        ("x", {"field": ["a"]}),
+        ("x", {"field": "b"}),
+        ("y", {"aggregate": ["count"]}),
+        ("y", {"aggregate": "nonsense"}),
+        ("y", {"aggregate": "mean", "field": "b"}),
+        ("y", {"aggregate": "sum", "field": "b"}),
+    ],
+)
+def test_pushdown_invalid(channel, changes):
+    "Invalid specifications are not pushed down."
+    specification = get_specification(channel, **changes)
+    assert datagraphics.pushdown.get_pushdown(specification, META) is None
+
+
+def test_served_specification(app):
+    "The specification for a large dataset uses the query resource."
+    graphic = {"specification": SPECIFICATION}
+    dataset = {"_id": IUID, "meta": META, "n_records": 1000}
+    specification, query = datagraphics.graphic.get_served_specification(
+        graphic, dataset
+    )
+    assert query is not None
+    assert specification["data"]["url"].startswith(
+        f"http://localhost/api/dataset/{IUID}/query?"
+    )
+
+    # Small dataset; not pushed down.
+    dataset["n_records"] = 10
+    specification, query = datagraphics.graphic.get_served_specification(
+        graphic, dataset
+    )
+    assert query is None
+    assert specification is SPECIFICATION
+
+
+@pytest.mark.parametrize(
+    "channel,changes",
+    [
+        ("x", {"bin": {"maxbins": 1}}),
+        ("x", {"bin": {"maxbins": "many"}}),
+        ("x", {"field": ["a"]}),
+        ("y", {"aggregate": "mean", "field": "b"}),
+    ],
+)
+def test_served_specification_invalid(app, channel, changes):
+    "An invalid specification for a large dataset is served as stored."
+    graphic = {"specification": get_specification(channel, **changes)}
+    dataset = {"_id": IUID, "meta": META, "n_records": 1000}
+    specification, query = datagraphics.graphic.get_served_specification(
+        graphic, dataset
+    )
+    assert query is None
+    assert specification is graphic["specification"]
+
+
+def test_served_specification_error(app):
+    "A specification flagged as invalid is served as stored."
+    graphic = {"specification": SPECIFICATION, "error": "Invalid."}
+    dataset = {"_id": IUID, "meta": META, "n_records": 1000}
+    specification, query = datagraphics.graphic.get_served_specification(
+        graphic, dataset
+    )
+    assert query is None
+    assert specification is SPECIFICATION
@@ -0,0 +1,97 @@
+"""Test the merge of summary statistics, as done when appending to a dataset.
+
+Does not need a running server.
+"""
+
+import json
+import math
+import random
+
+import pytest
+
+from datagraphics.columns import Columns
+from datagraphics.summary import SAMPLE_SIZE, Summary, merge_samples
+
+META = {
+    "i": {"type": "integer"},
+    "x": {"type": "number"},
+    "s": {"type": "string"},
+    "b": {"type": "boolean"},
+}
+
+
+def get_columns(n, seed):
+    "Return a column store of n random records, with some null values."
+    rng = random.Random(seed)
+    columns = Columns(META)
+    for pos in range(n):
+        columns.append(
+            {
+                "i": rng.randrange(1000) if pos % 7 else None,
+                "x": rng.gauss(10.0, 3.0) if pos % 11 else None,
+                "s": f"s{rng.randrange(200)}" if pos % 13 else None,
+                "b": rng.random() < 0.5,
+            }
+        )
+    return columns
+
+
+def get_meta(summary):
+    "Return the 'meta' entry statistics set by the summary."
+    meta = {}
+    summary.set_meta(meta)
+    return meta
+
+
+def round_trip(summary):
+    "Return the summary after conversion of its state to and from JSON."
+    return Summary.from_state(json.loads(json.dumps(summary.get_state())))
+
+
+@pytest.mark.parametrize("n_first,n_second", [(500, 300), (8000, 7000), (0, 100)])
+@pytest.mark.parametrize("key", ["i", "x", "s", "b"])
+def test_merge(key, n_first, n_second):
+    "Merge the summaries of two parts and compare with that of the whole."
+    first = get_columns(n_first, 1)
+    second = get_columns(n_second, 2)
+    whole = Columns(META)
+    whole.extend(first.records())
+    whole.extend(second.records())
+
+    expected = get_meta(Summary.from_column(whole[key]))
+    summary = round_trip(Summary.from_column(first[key], mergeable=True))
+    summary.merge(Summary.from_column(second[key], approximate=True))
+    merged = get_meta(round_trip(summary))
+
+    assert merged["approximate"]
+    assert merged["n_null"] == expected["n_null"]
+    for stat in ("min", "max"):
+        if stat in expected:
+            assert merged[stat] == expected[stat]
+    for stat in ("mean", "stdev"):
+        if stat in expected:
+            assert math.isclose(merged[stat], expected[stat], rel_tol=1e-9)
+    if "n_distinct" in expected:
+        assert math.isclose(merged["n_distinct"], expected["n_distinct"], rel_tol=0.05)
+    if "median" in expected:
+        assert math.isclose(merged["median"], expected["median"], rel_tol=0.05)
+
+
+def test_mergeable_exact():
+    "A mergeable summary has the exact statistics, and a state to merge."
+    columns = get_columns(1000, 3)
+    for key in META:
+        summary = Summary.from_column(columns[key], mergeable=True)
+        assert get_meta(summary) == get_meta(Summary.from_column(columns[key]))
+    summary = Summary.from_column(columns["i"], mergeable=True)
+    state = summary.get_state()
+    assert state["hll"]
+    assert len(state["sample"]) == len(columns) - columns["i"].n_null
+
+
+def test_merge_samples():
+    "The merged sample is bounded, and proportional to the populations."
+    sample = merge_samples([1] * SAMPLE_SIZE, 3000000, [2] * SAMPLE_SIZE, 1000000)
+    assert len(sample) == SAMPLE_SIZE
+    assert sample.count(1) == 3 * sample.count(2)
+    assert merge_samples([1, 2], 2, None, 0) == [1, 2]